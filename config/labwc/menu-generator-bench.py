@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+#
+# Benchmark for menu-generator.py
+#
+# Builds synthetic applications/ and icons/ trees (several icon themes, flatpak
+# exports as symlinks like flatpak makes them) in a temp dir, runs the generator
+# against them with an empty (cold) and a filled (warm) cache and reports wall
+# time, syscalls (when strace is installed), peak RSS and the per-phase numbers
+# the generator prints with --profile.
+#
+# usage: python3 menu-generator-bench.py --apps 100,1000,5000 --themes 3 --runs 3
+
+import argparse, os, re, shutil, subprocess, sys, tempfile, time
+
+generator = os.path.join(os.path.dirname(os.path.abspath(__file__)), "menu-generator.py")
+sizes = (16, 24, 32, 48, 64, 128, 256)
+contexts = ("apps", "categories", "devices", "mimetypes", "places", "status", "actions")
+categories = ("AudioVideo;Audio;", "Development;", "Game;", "Graphics;", "Network;WebBrowser;", "Office;", "Settings;", "System;", "Utility;", "GTK;Utility;", "")
+
+def write(path, data):
+	os.makedirs(os.path.dirname(path), exist_ok=True)
+	with open(path, "w") as f:
+		f.write(data)
+
+def build_theme(root, theme, inherits, fillers, appIcons):
+	dirs = [f"{size}x{size}/{context}" for size in sizes for context in contexts] + ["scalable/apps"]
+	index = f"[Icon Theme]\nName={theme}\nInherits={inherits}\nDirectories={','.join(dirs)}\n"
+	for d in dirs:
+		if d.startswith("scalable"):
+			index += f"\n[{d}]\nSize=48\nMinSize=16\nMaxSize=512\nType=Scalable\n"
+		else:
+			index += f"\n[{d}]\nSize={d.split('x', 1)[0]}\nType=Fixed\n"
+	write(f"{root}/icons/{theme}/index.theme", index)
+	for d in dirs:
+		ext = ".svg" if d.startswith("scalable") else ".png"
+		os.makedirs(f"{root}/icons/{theme}/{d}")
+		names = [f"filler-{d.split('/')[1]}-{i}" for i in range(fillers)]
+		if d.endswith("/apps"):
+			names += appIcons
+		for name in names:
+			open(f"{root}/icons/{theme}/{d}/{name}{ext}", "w").close()
+
+def build_tree(base, apps, themes, fillers, flatpakShare):
+	system = base + "/system"
+	flatpak = base + "/flatpak"
+	home = base + "/home"
+	bindir = base + "/bin"
+	os.makedirs(bindir)
+	write(home + "/.config/gtk-3.0/settings.ini", "[Settings]\ngtk-icon-theme-name=Theme1\n")
+	appIcons = [f"bench-app-{i}" for i in range(apps)]
+	build_theme(system, "hicolor", "", fillers, appIcons[::3])
+	for t in range(1, themes):
+		build_theme(system, f"Theme{t}", "hicolor", fillers, appIcons[t::3])
+	os.makedirs(system + "/pixmaps")
+	for i in range(apps):
+		exe = f"bench-prog-{i}"
+		with open(f"{bindir}/{exe}", "w") as f:
+			f.write("#!/bin/sh\n")
+		os.chmod(f"{bindir}/{exe}", 0o755)
+		entry = (f"[Desktop Entry]\nType=Application\nName=Bench App {i}\nComment=Synthetic entry {i}\n"
+			f"Exec={exe} %U\nIcon=bench-app-{i}\nTerminal={'true' if i % 9 == 0 else 'false'}\n"
+			f"Categories={categories[i % len(categories)]}\n")
+		if i < apps * flatpakShare: # flatpak exports are symlinks into the app's deploy dir
+			appId = f"org.bench.App{i}"
+			real = f"{flatpak}/app/{appId}/current/active/export/share/applications/{appId}.desktop"
+			write(real, entry)
+			os.makedirs(flatpak + "/exports/share/applications", exist_ok=True)
+			os.symlink(real, f"{flatpak}/exports/share/applications/{appId}.desktop")
+		else:
+			write(f"{system}/applications/bench-app-{i}.desktop", entry)
+	os.makedirs(flatpak + "/exports/share/applications", exist_ok=True)
+	return {"data_dirs": system + ":" + flatpak + "/exports/share", "home": home, "path": bindir + ":" + os.environ.get("PATH", "")}
+
+def run_generator(tree, cacheDir, extra):
+	env = dict(os.environ, HOME=tree["home"], XDG_CACHE_HOME=cacheDir, PATH=tree["path"])
+	cmd = [sys.executable, generator, "--data-dirs", tree["data_dirs"], "--no-reconfigure", "--profile"] + extra
+	with tempfile.TemporaryFile("w+") as err:
+		start = time.perf_counter()
+		proc = subprocess.Popen(cmd, env=env, stdout=subprocess.DEVNULL, stderr=err)
+		_, status, usage = os.wait4(proc.pid, 0)
+		wall = time.perf_counter() - start
+		proc.returncode = os.waitstatus_to_exitcode(status)
+		err.seek(0)
+		stderr = err.read()
+	if proc.returncode != 0:
+		sys.exit(f"generator failed:\n{stderr}")
+	phases = {}
+	for m in re.finditer(r"^profile: (\S+) ([\d.]+) ms, peak rss (\d+) KiB, (\d+) io syscalls", stderr, re.M):
+		phases[m.group(1)] = (float(m.group(2)), int(m.group(3)), int(m.group(4)))
+	return wall, usage.ru_maxrss, phases
+
+def count_syscalls(tree, cacheDir, extra): # total syscalls of one run, None without strace
+	if shutil.which("strace") is None:
+		return None
+	env = dict(os.environ, HOME=tree["home"], XDG_CACHE_HOME=cacheDir, PATH=tree["path"])
+	with tempfile.NamedTemporaryFile("r") as out:
+		subprocess.run(["strace", "-f", "-c", "-o", out.name, sys.executable, generator, "--data-dirs", tree["data_dirs"], "--no-reconfigure"] + extra,
+			env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+		for line in out.read().splitlines():
+			if line.strip().endswith("total"):
+				fields = line.split()
+				return int(fields[3]) if len(fields) >= 5 else int(fields[2])
+	return None
+
+def report(label, runs, syscalls):
+	walls = sorted(r[0] for r in runs)
+	print(f"  {label:<5} wall {walls[len(walls) // 2] * 1000:8.1f} ms (median of {len(runs)}), "
+		f"peak rss {max(r[1] for r in runs)} KiB, syscalls {syscalls if syscalls is not None else 'n/a (no strace)'}")
+	for phase in runs[0][2]:
+		ms = sorted(r[2][phase][0] for r in runs if phase in r[2])
+		last = runs[-1][2][phase]
+		print(f"        {phase:<8} {ms[len(ms) // 2]:8.2f} ms, peak rss {last[1]} KiB, {last[2]} io syscalls")
+
+if __name__ == "__main__":
+	parser = argparse.ArgumentParser(description="Benchmark menu-generator.py against synthetic application and icon trees.")
+	parser.add_argument("--apps", default="100,500,1000,5000", help="Comma separated numbers of .desktop files. Default: 100,500,1000,5000")
+	parser.add_argument("--themes", type=int, default=3, help="Icon themes including hicolor. Default: 3")
+	parser.add_argument("--icons", type=int, default=200, help="Filler icons per theme directory. Default: 200")
+	parser.add_argument("--flatpak", type=float, default=0.2, help="Share of apps exported by flatpak. Default: 0.2")
+	parser.add_argument("--runs", type=int, default=3, help="Runs per measurement. Default: 3")
+	parser.add_argument("--pipe", action="store_true", help="Benchmark the pipe menu instead of a static menu.xml.")
+	parser.add_argument("--keep", action="store_true", help="Keep the generated trees.")
+	args, extra = parser.parse_known_args() # everything else is passed to the generator, e.g. --jobs 4
+
+	base = tempfile.mkdtemp(prefix="menu-generator-bench-")
+	try:
+		for apps in [int(x) for x in args.apps.split(",")]:
+			treeDir = f"{base}/{apps}"
+			start = time.perf_counter()
+			tree = build_tree(treeDir, apps, args.themes, args.icons, args.flatpak)
+			print(f"{apps} apps, {args.themes} themes ({time.perf_counter() - start:.1f} s to build)")
+			if not args.pipe:
+				extra = extra + ["-o", treeDir + "/menu.xml"]
+			cold = []
+			for i in range(args.runs):
+				shutil.rmtree(treeDir + "/cache", ignore_errors=True)
+				cold.append(run_generator(tree, treeDir + "/cache", extra))
+			coldSyscalls = count_syscalls(tree, treeDir + "/cache-strace", extra)
+			warm = [run_generator(tree, treeDir + "/cache", extra) for i in range(args.runs)]
+			warmSyscalls = count_syscalls(tree, treeDir + "/cache", extra)
+			report("cold", cold, coldSyscalls)
+			report("warm", warm, warmSyscalls)
+			if not args.pipe:
+				extra = extra[:-2]
+	finally:
+		if args.keep:
+			print(f"trees kept in {base}")
+		else:
+			shutil.rmtree(base, ignore_errors=True)
@@ -18,109 +18,782 @@
 # - ADDED: Static file generation with pretty printing for Labwc
 # - ADDED: Custom Footer with dynamic icons and separator
 # - ADDED: Auto-reconfigure Labwc after static generation
+# - ADDED: Icon index keyed by icon name, exact lookups instead of list scans
+# - ADDED: Icon directory listings cached in ~/.cache/menu-generator, rescanned on mtime change
+# - ADDED: Parsed .desktop files cached by path, mtime and size, only changed files are parsed again
+# - ADDED: --watch daemon mode, regenerates the static menu on inotify events
+# - ADDED: $PATH executable index, Exec commands checked with a set lookup
+# - ADDED: --jobs N, parses changed .desktop files in a process pool
+# - ADDED: Menu built in one buffer, written atomically, unchanged menus skip the reconfigure
+# - ADDED: Changed categories and items reported on stderr, reconfigure only on real changes
+# - ADDED: Icon themes read from index.theme (Directories, Inherits), closest size to --icon-size
+# - ADDED: --lazy root menu of per-category pipe menus (--category X), drawn from the last scan
+# - ADDED: --profile phase timings and --data-dirs, used by menu-generator-bench.py
+# - FIXED: XML escaping in one pass, labels escaped once in static and pipe menus
+# - ADDED: Desktop Entry spec parsing: NoDisplay, Hidden, OnlyShowIn/NotShowIn, TryExec, Name[xx]
+# - ADDED: --actions, submenus of the Desktop Actions of an app (new window, private window ...)
+# - ADDED: --frequent N, most launched apps first, from a launch log written by --launch
+# - ADDED: --raster-icons, menu icons rendered once at --icon-size into ~/.cache/menu-generator/icons
+# - ADDED: --search-index for launchers and --rofi, a rofi script mode reading that index
+# - ADDED: --batch, several menus (footer, format, terminal, icon size/theme) from one scan
+# - ADDED: Optional menu-generator.toml/.json for terminal, groups, aliases, ignore patterns and footer
+# - ADDED: XDG_DATA_HOME/XDG_DATA_DIRS, user flatpak and snap dirs, desktop file IDs deduplicated by precedence
 #
 # ----- config ---
 
-import subprocess, glob, os, sys, argparse
+import subprocess, os, sys, argparse, json, select, struct, time, shlex, hashlib, fcntl, shutil, re
+import xml.etree.ElementTree as ET
 
 userhome = os.path.expanduser('~')
-applications_dirs = ("/usr/share/applications", userhome + "/.local/share/applications","/var/lib/flatpak/exports/share/applications")
-image_dir_base = ("/usr/share", "/var/lib/flatpak/exports/share") # without "pixmaps" -/usr/local/share in FreeBSD, /usr/share on linux
+data_home = os.environ.get("XDG_DATA_HOME") or userhome + "/.local/share"
+
+def xdg_data_dirs(): # data dirs by precedence: $XDG_DATA_HOME, $XDG_DATA_DIRS, then flatpak and snap exports it lacks
+	dirs = [data_home] + [x for x in (os.environ.get("XDG_DATA_DIRS") or "/usr/local/share:/usr/share").split(":") if x]
+	dirs += [data_home + "/flatpak/exports/share", "/var/lib/flatpak/exports/share", "/var/lib/snapd/desktop"]
+	return dirs
+
+def set_data_dirs(dirs): # applications/, icons/ and pixmaps/ of these data dirs, the first one wins
+	global data_dirs, applications_dirs, icon_base_dirs, pixmap_dirs
+	seen = set()
+	data_dirs = []
+	for path in dirs:
+		real = os.path.realpath(path)
+		if real not in seen and os.path.isdir(path): # a dir listed twice (or through a symlink) is scanned once
+			seen.add(real)
+			data_dirs.append(path)
+	applications_dirs = tuple(x + "/applications" for x in data_dirs)
+	icon_base_dirs = (userhome + "/.icons",) + tuple(x + "/icons" for x in data_dirs) # icon theme spec order
+	pixmap_dirs = tuple(x + "/pixmaps" for x in data_dirs if x != data_home)
+
+set_data_dirs(xdg_data_dirs())
+
+cache_dir = (os.environ.get("XDG_CACHE_HOME") or userhome + "/.cache") + "/menu-generator"
+
+gtk3_config = userhome + "/.config/gtk-3.0/settings.ini"
 
 # --- Theme Selection Logic ---
-selected_theme = None
-
-# Priority: Check GTK 3.0 settings
-try:
-	gtk3_config = userhome + "/.config/gtk-3.0/settings.ini"
-	if os.path.exists(gtk3_config):
-		with open(gtk3_config, 'r') as f:
-			for line in f:
-				if "gtk-icon-theme-name" in line and "=" in line:
-					selected_theme = line.split("=", 1)[1].strip().strip('"').strip("'")
-					break
-except IOError:
-	pass
+def detect_icon_theme():
+	selected_theme = None
 
-# Fallback: Check GTK 2.0 config
-if selected_theme is None:
+	# Priority: Check GTK 3.0 settings
 	try:
-		with open(userhome + "/.gtkrc-2.0", 'r') as readobj:
-			for line in readobj:
-				if "gtk-icon-theme-name" in line:
-					parts = line.split("\"")
-					if len(parts) > 1:
-						selected_theme = parts[1]
+		if os.path.exists(gtk3_config):
+			with open(gtk3_config, 'r') as f:
+				for line in f:
+					if "gtk-icon-theme-name" in line and "=" in line:
+						selected_theme = line.split("=", 1)[1].strip().strip('"').strip("'")
 						break
 	except IOError:
 		pass
 
-# Final Fallback
-if selected_theme is None:
-	selected_theme = "Adwaita"
+	# Fallback: Check GTK 2.0 config
+	if selected_theme is None:
+		try:
+			with open(userhome + "/.gtkrc-2.0", 'r') as readobj:
+				for line in readobj:
+					if "gtk-icon-theme-name" in line:
+						parts = line.split("\"")
+						if len(parts) > 1:
+							selected_theme = parts[1]
+							break
+		except IOError:
+			pass
+
+	# Final Fallback
+	if selected_theme is None:
+		selected_theme = "Adwaita"
+	return selected_theme
 
 application_groups = ("AudioVideo", "Development", "Editors",  "Engineering", "Games", "Graphics", "Internet",  "Multimedia", "Office",  "Other",  "Settings", "System",  "Utilities") # enter here new category as you wish, it will be sorted
 group_aliases = {"Audio":"Multimedia","Video":"Multimedia","AudioVideo":"Multimedia","Network":"Internet","Game":"Games", "Utility":"Utilities", "Development":"Editors","GTK":"",  "GNOME":""}
 ignoreList = ("gtk3-icon-browser","evince-previewer", "Ted",  "wingide3.2", "python3.4", "feh","xfce4-power-manager-settings", "picom","compton","yad-icon-browser" )
-prefixes = ("legacy","categories","apps","devices","mimetypes","places","preferences","actions", "status","emblems") #added for prefered icon dirs and sizes. could be gathered automatically but wouldn't be sorted like this
-iconSizes = ("48","32","24","16","48x48","40x40","36x36","32x32","24x24","64x64","72x72","96x96","16x16","128x128","256x256","scalable","apps","symbolic")
+icon_size = 48 # menu icon size in pixels, icons of the closest size are picked
 terminal_string = "foot"
+show_actions = False # submenus of [Desktop Action] entries (new window, private window ...), set by --actions
+
+# Define custom items: [Label, ActionName, Command, PossibleIcons]
+# Change this according to you
+footer_items = [
+	{
+		"label": "Terminal", 
+		"action": "Execute", 
+		"cmd": "foot", 
+		"icons": ["terminal", "x-terminal-emulator", "org.gnome.Terminal"]
+	},
+	{
+		"label": "Reconfigure", 
+		"action": "Reconfigure", 
+		"cmd": None, 
+		"icons": ["system-reboot", "view-refresh", "reload"]
+	},
+	{
+		"label": "Proton VPN", 
+		"action": "Execute", 
+		"cmd": "protonvpn-app", 
+		"icons": ["proton-vpn-logo", "network-vpn", "nm-vpn-standalone-lock"]
+	},
+	{
+		"label": "Background", 
+		"action": "Execute", 
+		"cmd": f"sh -c '{userhome}/.config/rofi/wallselect/wallselect.sh'",
+		"icons": ["preferences-desktop-wallpaper", "wallpaper", "background"]
+	},
+	{
+		"label": "Exit", 
+		"action": "Exit", 
+		"cmd": None, 
+		"icons": ["system-log-out", "gnome-logout"]
+	}
+]
   
+#optional config file, its keys replace the settings above: terminal, groups, aliases (merged into group_aliases),
+#ignore (substrings of .desktop paths), ignore_regex and footer (a list of tables/objects with label, action, cmd
+#and icons). ~/.config/labwc/menu-generator.toml (python 3.11+) or menu-generator.json, or --config PATH.
+#it is parsed once per change, the checked result is kept in ~/.cache/menu-generator/config.json
+config_home = os.environ.get("XDG_CONFIG_HOME") or userhome + "/.config"
+config_files = (config_home + "/labwc/menu-generator.toml", config_home + "/labwc/menu-generator.json")
+config_stamp = None # [path, mtime, size] of the config file in use, part of every cache that depends on it
+config_cache_version = 2 # bumped when read_config checks more, so configs cached unchecked are read again
+
+def read_config(path): # parse and check a config file, ValueError on mistakes
+	with open(path, "rb") as f:
+		if path.endswith(".toml"):
+			try:
+				import tomllib
+			except ImportError:
+				raise ValueError("TOML needs python 3.11+, use menu-generator.json")
+			try:
+				data = tomllib.load(f)
+			except tomllib.TOMLDecodeError as e:
+				raise ValueError(str(e))
+		else:
+			data = json.load(f)
+	if not isinstance(data, dict):
+		raise ValueError("not a table of settings")
+	conf = {}
+	for key, value in data.items():
+		if key == "terminal" and isinstance(value, str):
+			conf[key] = value
+		elif key in ("groups", "ignore", "ignore_regex") and isinstance(value, list) and all(isinstance(x, str) for x in value):
+			conf[key] = value
+		elif key == "aliases" and isinstance(value, dict) and all(isinstance(x, str) for x in value.values()):
+			conf[key] = value
+		elif key == "footer" and isinstance(value, list):
+			footer = []
+			for item in value:
+				if not isinstance(item, dict) or not isinstance(item.get("label"), str):
+					raise ValueError("footer items need a label")
+				action, cmd, icons = item.get("action", "Execute"), item.get("cmd"), item.get("icons", [])
+				if not isinstance(action, str):
+					raise ValueError(f"footer item '{item['label']}': action must be a string")
+				if cmd is not None and not isinstance(cmd, str):
+					raise ValueError(f"footer item '{item['label']}': cmd must be a string")
+				if not isinstance(icons, list) or not all(isinstance(x, str) for x in icons):
+					raise ValueError(f"footer item '{item['label']}': icons must be a list of names")
+				footer.append({"label": item["label"], "action": action, "cmd": cmd, "icons": icons})
+			conf[key] = footer
+		else:
+			raise ValueError(f"unknown or invalid setting '{key}'")
+	for pattern in conf.get("ignore_regex", []):
+		try:
+			re.compile(pattern)
+		except re.error as e:
+			raise ValueError(f"ignore_regex '{pattern}': {e}")
+	return conf
+
+def load_config(path=None): # {} if there is no config file or it has mistakes
+	global config_stamp
+	for candidate in ([path] if path else config_files):
+		try:
+			st = os.stat(candidate)
+		except OSError:
+			continue
+		config_stamp = [candidate, st.st_mtime_ns, st.st_size]
+		cacheFile = cache_dir + "/config.json"
+		try:
+			with open(cacheFile, "r") as f:
+				cached = json.load(f)
+			if cached.get("version") == config_cache_version and cached["source"] == config_stamp:
+				return cached["config"]
+		except (OSError, ValueError, KeyError, TypeError):
+			pass
+		try:
+			conf = read_config(candidate)
+		except (OSError, ValueError) as e:
+			print(f"Error in {candidate}: {e}, using the defaults", file=sys.stderr)
+			return {}
+		try:
+			os.makedirs(cache_dir, exist_ok=True)
+			with open(cacheFile + ".tmp", "w") as f:
+				json.dump({"version": config_cache_version, "source": config_stamp, "config": conf}, f, separators=(",", ":"))
+			os.replace(cacheFile + ".tmp", cacheFile)
+		except OSError:
+			pass
+		return conf
+	if path:
+		print(f"Error: config {path} not found, using the defaults", file=sys.stderr)
+	return {}
+
+def apply_config(conf):
+	global terminal_string, application_groups, group_aliases, ignoreList, footer_items
+	terminal_string = conf.get("terminal", terminal_string)
+	application_groups = tuple(conf.get("groups", application_groups))
+	group_aliases = dict(group_aliases, **conf.get("aliases", {}))
+	ignoreList = tuple(conf.get("ignore", ignoreList))
+	footer_items = conf.get("footer", footer_items)
+	compile_config(conf.get("ignore_regex", []))
+
+category_map = {} # category of a .desktop file -> menu group, "" to drop it
+ignore_matcher = None # one regex for ignoreList and ignore_regex, None if nothing is ignored
+
+def compile_config(ignoreRegex=()):
+	global category_map, ignore_matcher
+	category_map = {group: group for group in application_groups}
+	for cat, group in group_aliases.items():
+		category_map[cat] = group if group == "" or group in application_groups else ""
+	patterns = [re.escape(x) for x in ignoreList] + list(ignoreRegex)
+	ignore_matcher = re.compile("|".join(f"(?:{x})" for x in patterns)) if patterns else None
+
+compile_config()
+
 #constants and list for icon list generating
 image_file_prefix = (".png", ".svg", ".xpm")
 image_cat_prefix = ("applications-", "accessories-dictionary", "accessories-text-editor","preferences-desktop.","audio-speakers") 
-iconThemes=os.listdir(image_dir_base[0]+"/icons")
-tmplst=[s for s in iconThemes if selected_theme in s]
-selected_theme = iconThemes[0] if tmplst == [] else tmplst[0]
-iconThemes.sort(key=str.lower)
-
-if selected_theme in iconThemes:
-	iconThemes.remove(selected_theme)
-iconThemes.remove('hicolor') if 'hicolor' in iconThemes else False
-iconThemes.insert(0, selected_theme) if selected_theme != 'hicolor' else False
-iconThemes.insert(0, "hicolor")
-iconList=[]
-
-#getting icons to lists for faster menu generate
-def addIconsToList(List, theme): # skip to next icon theme if any icon couldn't found on current
-	for path in reversed(image_dir_base):
-		for prfx in prefixes:
-			for size in iconSizes:
-				tmp = path + "/icons/" + theme + "/" + size + "/" + prfx
-				if theme == "breeze" or theme == "breeze-dark":
-					tmp = path + "/icons/" + theme + "/" + prfx + "/" + size
+
+def load_icon_themes(theme=None): # (re)detect the icon theme, or use this one, and start a fresh icon index
+	global selected_theme, iconThemes, iconIndex
+	iconCache.refresh()
+	selected_theme = theme or detect_icon_theme()
+	installed = []
+	for base in icon_base_dirs:
+		try:
+			installed += [x for x in os.listdir(base) if x not in installed]
+		except OSError:
+			continue
+	installed.sort(key=str.lower)
+	tmplst=[s for s in installed if selected_theme in s]
+	if selected_theme not in installed:
+		selected_theme = installed[0] if tmplst == [] else tmplst[0]
+
+	# selected theme, the themes it inherits (depth first), hicolor, then every other theme
+	iconThemes = []
+	def addTheme(theme, inherits):
+		if theme in iconThemes or theme not in installed:
+			return
+		iconThemes.append(theme)
+		if inherits:
+			for parent in iconCache.theme(theme)["index"]["inherits"]:
+				addTheme(parent, True)
+	addTheme(selected_theme, True)
+	addTheme("hicolor", True)
+	for theme in installed:
+		addTheme(theme, False) # index.theme of fallback themes is only read when they are searched
+	iconIndex = IconIndex(iconThemes, iconCache, icon_size)
+
+def read_index_theme(theme): # Inherits, Directories and their Size/Type keys of an icon theme
+	for base in icon_base_dirs: # the first index.theme found is used for every base dir
+		try:
+			with open(base + "/" + theme + "/index.theme", "r", errors="replace") as f:
+				lines = f.read().splitlines()
+		except OSError:
+			continue
+		groups = {}
+		group = None
+		for l in lines:
+			l = l.strip()
+			if len(l) < 1 or l[0] == '#':
+				continue
+			if l[0] == '[' and l[-1] == ']':
+				group = groups.setdefault(l[1:-1], {})
+				continue
+			eqi = l.split('=', 1)
+			if group is not None and len(eqi) == 2:
+				group[eqi[0].strip()] = eqi[1].strip()
+		head = groups.get("Icon Theme", {})
+		dirs = []
+		for name in head.get("Directories", "").split(","):
+			name = name.strip()
+			if name == "" or name not in groups:
+				continue
+			keys = groups[name]
+			try:
+				if int(keys.get("Scale", "1")) != 1:
+					continue
+				size = int(keys["Size"])
+				dirs.append({"name": name, "type": keys.get("Type", "Threshold"), "size": size,
+					"min": int(keys.get("MinSize", size)), "max": int(keys.get("MaxSize", size)),
+					"threshold": int(keys.get("Threshold", 2))})
+			except (KeyError, ValueError):
+				continue
+		inherits = [x.strip() for x in head.get("Inherits", "").split(",") if x.strip() != ""]
+		return {"inherits": inherits, "dirs": dirs}
+	return guess_index_theme(theme)
+
+def guess_index_theme(theme): # layout of a theme without index.theme, from its <size>/<context> or <context>/<size> dirs
+	dirs = []
+	for base in icon_base_dirs:
+		root = base + "/" + theme
+		try:
+			children = sorted(os.listdir(root))
+		except OSError:
+			continue
+		for child in children:
+			try:
+				grandchildren = sorted(x for x in os.listdir(root + "/" + child) if os.path.isdir(root + "/" + child + "/" + x))
+			except OSError:
+				continue
+			for grandchild in grandchildren:
+				name = child + "/" + grandchild
+				if any(d["name"] == name for d in dirs):
+					continue
+				sizes = [x for x in (child, grandchild) if x.split("x", 1)[0].isdigit()]
+				if len(sizes) > 0:
+					size = int(sizes[0].split("x", 1)[0])
+					dirs.append({"name": name, "type": "Threshold", "size": size, "min": size, "max": size, "threshold": 2})
+				elif "scalable" in (child, grandchild) or "symbolic" in (child, grandchild):
+					dirs.append({"name": name, "type": "Scalable", "size": 48, "min": 1, "max": 512, "threshold": 2})
+	return {"inherits": [], "dirs": dirs}
+
+def size_distance(d, size): # DirectorySizeDistance of the icon theme spec, 0 if the directory matches
+	if d["type"] == "Fixed":
+		return abs(d["size"] - size)
+	if d["type"] == "Scalable":
+		return max(d["min"] - size, size - d["max"], 0)
+	return max(d["size"] - d["threshold"] - size, size - d["size"] - d["threshold"], 0)
+
+#parsed index.theme files and directory listings, so unchanged icon themes cost a stat pass instead of listdir calls
+class IconCache(object):
+	version = 2
+
+	def __init__(self, fileName):
+		self.fileName = fileName
+		self.dirty = False
+		self.themes = {}
+		self.stamps = {}
+		try:
+			with open(fileName, "r") as f:
+				data = json.load(f)
+			if data.get("version") == self.version:
+				self.themes = data["themes"]
+		except (OSError, ValueError, KeyError, AttributeError):
+			pass
+
+	def refresh(self): # stat themes again (--watch)
+		self.stamps = {}
+
+	def themeStamp(self, theme): # mtimes of each theme root and its index.theme
+		if theme in self.stamps:
+			return self.stamps[theme]
+		stamp = []
+		for base in icon_base_dirs:
+			root = base + "/" + theme
+			for fpath in (root, root + "/index.theme"):
+				try:
+					stamp.append(os.stat(fpath).st_mtime_ns)
+				except OSError:
+					stamp.append(None)
+		self.stamps[theme] = stamp
+		return stamp
+
+	def theme(self, theme): # cache entry of a theme, index.theme is parsed again when the stamp changed
+		stamp = self.themeStamp(theme)
+		entry = self.themes.get(theme)
+		if entry is None or entry["stamp"] != stamp:
+			entry = {"stamp": stamp, "index": read_index_theme(theme), "dirs": entry["dirs"] if entry is not None else {}, "probed": False}
+			self.themes[theme] = entry
+			self.dirty = True
+		return entry
+
+	def listDirs(self, old, dirPaths):
+		dirs = {}
+		for dirPath in dirPaths:
+			try:
+				mtime = os.stat(dirPath).st_mtime_ns
+			except OSError:
+				continue
+			entry = old.get(dirPath)
+			if entry is None or entry[0] != mtime:
 				try:
-					List.extend(tmp + "/" +  x for x in os.listdir(tmp) if x.lower().endswith(image_file_prefix))
-				except IOError:
+					entry = [mtime, [x for x in os.listdir(dirPath) if x.lower().endswith(image_file_prefix)]]
+				except OSError:
 					continue
-	return List
+				self.dirty = True
+			dirs[dirPath] = entry
+		if len(dirs) != len(old):
+			self.dirty = True
+		return dirs
+
+	def listTheme(self, theme): # only the directories declared in index.theme are listed
+		entry = self.theme(theme)
+		dirPaths = [base + "/" + theme + "/" + d["name"] for d in entry["index"]["dirs"] for base in icon_base_dirs]
+		if entry["probed"]:
+			# with an unchanged stamp only directories known to exist are checked again.
+			# new directories show up in the stamp, since installing icons rewrites
+			# icon-theme.cache (root mtime) or index.theme
+			dirPaths = [x for x in dirPaths if x in entry["dirs"]]
+		entry["dirs"] = self.listDirs(entry["dirs"], dirPaths)
+		if not entry["probed"]:
+			entry["probed"] = True
+			self.dirty = True
+		return entry
+
+	def listPixmaps(self):
+		entry = self.themes.setdefault("", {"dirs": {}})
+		entry["dirs"] = self.listDirs(entry["dirs"], list(pixmap_dirs))
+		return entry["dirs"]
+
+	def iconStamp(self, themes, size): # changes whenever icon lookups could give another result
+		pixmaps = []
+		for path in pixmap_dirs:
+			try:
+				pixmaps.append(os.stat(path).st_mtime_ns)
+			except OSError:
+				pixmaps.append(None)
+		return [size, pixmaps] + [[theme] + self.themeStamp(theme) for theme in themes]
+
+	def save(self):
+		if not self.dirty:
+			return
+		tmp = self.fileName + ".tmp"
+		try:
+			os.makedirs(os.path.dirname(self.fileName), exist_ok=True)
+			with open(tmp, "w") as f:
+				json.dump({"version": self.version, "themes": self.themes}, f, separators=(",", ":"))
+			os.replace(tmp, self.fileName)
+			self.dirty = False
+		except OSError:
+			pass
+
+#icon index keyed by icon name (file name without extension) for exact lookups
+class IconIndex(object):
+	def __init__(self, themes, cache, size):
+		self.themes = list(themes)
+		self.cache = cache
+		self.size = size
+		self.loaded = 0
+		self.icons = {} # name -> (rank, path), lower rank wins
+		for dirPath, entry in cache.listPixmaps().items(): # pixmaps win over any theme
+			self.addFiles(dirPath, entry[1], (-1, 0, 0))
+
+	def addFiles(self, dirPath, files, rank):
+		for x in files:
+			name, ext = os.path.splitext(x)
+			r = rank + (image_file_prefix.index(ext.lower()),)
+			old = self.icons.get(name)
+			if old is None or r < old[0]:
+				self.icons[name] = (r, dirPath + "/" + x)
+
+	def addTheme(self, themeRank): # skip to next icon theme if any icon couldn't found on current
+		theme = self.themes[themeRank]
+		entry = self.cache.listTheme(theme)
+		for dirOrder, d in enumerate(entry["index"]["dirs"]):
+			rank = (themeRank, size_distance(d, self.size), dirOrder)
+			for base in icon_base_dirs: # the same icon in two base dirs is taken from the first
+				dirPath = base + "/" + theme + "/" + d["name"]
+				listing = entry["dirs"].get(dirPath)
+				if listing is not None:
+					self.addFiles(dirPath, listing[1], rank)
+
+	def find(self, name):
+		if name.lower().endswith(image_file_prefix): # "Icon=foo.png" is wrong but common
+			name = os.path.splitext(name)[0]
+		while name not in self.icons and self.loaded < len(self.themes):
+			self.addTheme(self.loaded)
+			self.loaded += 1
+		if name in self.icons:
+			return self.icons[name][1]
+		return ""
+
+	def findAny(self, names): # the first name found in the best theme, like FindBestIcon of the spec
+		names = [os.path.splitext(x)[0] if x.lower().endswith(image_file_prefix) else x for x in names]
+		while True:
+			found = [(self.icons[name][0][0], i) for i, name in enumerate(names) if name in self.icons]
+			if found: # themes load in rank order, so nothing in a theme still unloaded could beat these
+				return self.icons[names[min(found)[1]]][1]
+			if self.loaded >= len(self.themes):
+				return ""
+			self.addTheme(self.loaded)
+			self.loaded += 1
+
+#menu icons rendered once at the menu size into ~/.cache/menu-generator/icons/<size>/, keyed by source path and mtime.
+#a rendered icon is dropped once its source changes or disappears, sources that can't be rendered are used as they are
+class IconRaster(object):
+	version = 1
+
+	def __init__(self, dirName, size):
+		self.dirName = dirName
+		self.size = size
+		self.fileName = dirName + "/manifest.json"
+		self.icons = {} # source path -> [mtime_ns, rendered file name, "" if it is used as it is]
+		self.dirty = False
+		self.backend = None
+		try:
+			with open(self.fileName, "r") as f:
+				data = json.load(f)
+			if data.get("version") == self.version and data["size"] == size:
+				self.icons = data["icons"]
+		except (OSError, ValueError, KeyError, AttributeError):
+			pass
+
+	def find(self, path): # the file the menu should point at for this icon
+		if not path:
+			return path
+		try:
+			mtime = os.stat(path).st_mtime_ns
+		except OSError:
+			return path
+		entry = self.icons.get(path)
+		if entry is None or entry[0] != mtime:
+			if entry is not None and entry[1]:
+				self.remove(entry[1])
+			entry = self.icons[path] = [mtime, self.render(path, mtime)]
+			self.dirty = True
+		return self.dirName + "/" + entry[1] if entry[1] else path
+
+	def render(self, path, mtime): # rendered file name, "" to keep the source
+		ext = os.path.splitext(path)[1].lower()
+		if ext == ".png" and png_width(path) <= self.size: # nothing to gain
+			return ""
+		if self.backend is None:
+			self.backend = raster_backends()
+		name = hashlib.sha1(f"{path}\0{mtime}".encode()).hexdigest()[:20] + ".png"
+		out = self.dirName + "/" + name
+		os.makedirs(self.dirName, exist_ok=True)
+		for backend in self.backend:
+			if ext in backend[0] and backend[1](path, out + ".tmp", self.size):
+				try:
+					os.replace(out + ".tmp", out)
+					return name
+				except OSError:
+					break
+		self.remove(name + ".tmp")
+		return ""
+
+	def remove(self, name):
+		try:
+			os.unlink(self.dirName + "/" + name)
+		except OSError:
+			pass
+
+	def evict(self): # rendered icons of sources that changed or were removed since they were rendered
+		for path, entry in list(self.icons.items()):
+			try:
+				current = os.stat(path).st_mtime_ns == entry[0]
+			except OSError:
+				current = False
+			if not current:
+				if entry[1]:
+					self.remove(entry[1])
+				del self.icons[path]
+				self.dirty = True
+
+	def save(self):
+		self.evict()
+		if not self.dirty:
+			return
+		tmp = self.fileName + ".tmp"
+		try:
+			os.makedirs(self.dirName, exist_ok=True)
+			with open(tmp, "w") as f:
+				json.dump({"version": self.version, "size": self.size, "icons": self.icons}, f, separators=(",", ":"))
+			os.replace(tmp, self.fileName)
+			self.dirty = False
+		except OSError:
+			pass
+
+iconRaster = None # set by --raster-icons
+
+def menu_icon(path): # rendered copy of an icon when --raster-icons is on
+	if iconRaster is None or not path:
+		return path
+	return iconRaster.find(path)
+
+def png_width(path): # from the IHDR chunk, 0 if the file is no png (no renderer would take it either)
+	try:
+		with open(path, "rb") as f:
+			head = f.read(24)
+	except OSError:
+		return 0
+	if len(head) < 24 or head[:8] != b"\x89PNG\r\n\x1a\n":
+		return 0
+	return struct.unpack(">I", head[16:20])[0]
+
+def run_quiet(cmd):
+	try:
+		return subprocess.run(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, timeout=10).returncode == 0
+	except (OSError, subprocess.SubprocessError):
+		return False
+
+def raster_backends(): # [(extensions, render(src, out, size) -> ok)], GdkPixbuf if PyGObject is installed, then rsvg-convert and ImageMagick
+	backends = []
+	try:
+		import gi
+		gi.require_version("GdkPixbuf", "2.0")
+		from gi.repository import GdkPixbuf
+		def pixbuf(src, out, size):
+			try:
+				GdkPixbuf.Pixbuf.new_from_file_at_scale(src, size, size, True).savev(out, "png", [], [])
+				return True
+			except Exception: # GLib.Error, the loader for this format may be missing
+				return False
+		backends.append((image_file_prefix, pixbuf))
+	except (ImportError, ValueError):
+		pass
+	if shutil.which("rsvg-convert"):
+		backends.append(((".svg",), lambda src, out, size: run_quiet(["rsvg-convert", "-a", "-w", str(size), "-h", str(size), "-f", "png", "-o", out, src])))
+	magick = shutil.which("magick") or shutil.which("convert")
+	if magick:
+		backends.append((image_file_prefix, lambda src, out, size: run_quiet([magick, "-background", "none", src + "[0]", "-resize", f"{size}x{size}", "png:" + out])))
+	return backends
+
+#persistent parse results of .desktop files, checked against mtime and size of each file
+class DesktopCache(object):
+	version = 6
+
+	def __init__(self, fileName, iconStamp):
+		self.fileName = fileName
+		self.iconStamp = iconStamp
+		self.iconsValid = False # resolved icons are only reused while icon themes are unchanged
+		self.old = {}
+		self.entries = {}
+		try:
+			with open(fileName, "r") as f:
+				data = json.load(f)
+			if data.get("version") == self.version and data["env"] == self.env():
+				self.old = data["entries"]
+				self.iconsValid = data["icons"] == iconStamp
+		except (OSError, ValueError, KeyError, AttributeError):
+			pass
+
+	def env(self): # parse results depend on the locale (Name[xx]) and the desktop (OnlyShowIn)
+		return [list(locale_rank), current_desktops, config_stamp]
+
+	def get(self, dtf, st):
+		entry = self.old.get(dtf)
+		if entry is None or entry[0] != st.st_mtime_ns or entry[1] != st.st_size:
+			return None
+		return entry[2]
+
+	def put(self, dtf, st, fields):
+		self.entries[dtf] = [st.st_mtime_ns, st.st_size, fields]
+
+	def setIconStamp(self, iconStamp):
+		self.iconsValid = self.iconsValid and iconStamp == self.iconStamp
+		self.iconStamp = iconStamp
+
+	def save(self): # entries of deleted files are dropped, since only files seen in this run are kept
+		if not self.iconsValid or self.entries != self.old:
+			tmp = self.fileName + ".tmp"
+			try:
+				os.makedirs(os.path.dirname(self.fileName), exist_ok=True)
+				with open(tmp, "w") as f:
+					json.dump({"version": self.version, "env": self.env(), "icons": self.iconStamp, "entries": self.entries}, f, separators=(",", ":"))
+				os.replace(tmp, self.fileName)
+			except OSError:
+				pass
+		self.old, self.entries = self.entries, {} # the next scan (--watch) starts from this one
+		self.iconsValid = True
+
+def is_exe(fpath):
+	return os.path.isfile(fpath) and os.access(fpath, os.X_OK)
+
+#executables on $PATH, each directory is listed once and the listing cached by its mtime
+class PathIndex(object):
+	version = 1
+
+	def __init__(self, fileName):
+		self.fileName = fileName
+		self.dirty = False
+		self.dirs = {} # dir -> [mtime, [executables]]
+		self.programs = None # name -> first dir on $PATH that has it
+		try:
+			with open(fileName, "r") as f:
+				data = json.load(f)
+			if data.get("version") == self.version:
+				self.dirs = data["dirs"]
+		except (OSError, ValueError, KeyError, AttributeError):
+			pass
+
+	def refresh(self): # a stat pass over $PATH, only changed directories are listed again
+		dirs = {}
+		programs = {}
+		for path in os.environ.get("PATH", "").split(os.pathsep):
+			if path == "" or path in dirs:
+				continue
+			try:
+				mtime = os.stat(path).st_mtime_ns
+			except OSError:
+				continue
+			entry = self.dirs.get(path)
+			if entry is None or entry[0] != mtime:
+				try:
+					with os.scandir(path) as it:
+						entry = [mtime, [e.name for e in it if e.is_file() and os.access(e.path, os.X_OK)]]
+				except OSError:
+					continue
+				self.dirty = True
+			dirs[path] = entry
+			for name in entry[1]:
+				programs.setdefault(name, path)
+		if list(dirs) != list(self.dirs):
+			self.dirty = True
+		self.dirs = dirs
+		self.programs = programs
+
+	def find(self, program):
+		if self.programs is None:
+			self.refresh()
+		path = self.programs.get(program)
+		if path is None:
+			return None
+		return os.path.join(path, program)
+
+	def save(self):
+		if not self.dirty:
+			return
+		tmp = self.fileName + ".tmp"
+		try:
+			os.makedirs(os.path.dirname(self.fileName), exist_ok=True)
+			with open(tmp, "w") as f:
+				json.dump({"version": self.version, "dirs": self.dirs}, f, separators=(",", ":"))
+			os.replace(tmp, self.fileName)
+			self.dirty = False
+		except OSError:
+			pass
 
 def which(program): #check if program exist
-	def is_exe(fpath):
-		return os.path.isfile(fpath) and os.access(fpath, os.X_OK)
 	fpath, fname = os.path.split(program)
 	if fpath:
 		if is_exe(program):
 			return program
-	else:
-		for path in os.environ["PATH"].split(os.pathsep):
-			exe_file = os.path.join(path, program)
-			if is_exe(exe_file):
-				return exe_file
-	return None
+		return None
+	return pathIndex.find(program)
 
-# Helper to find specific icons for the footer
-def find_best_icon(possible_names):
-	for name in possible_names:
-		# Search in our generated iconList
-		# look for /name.png or /name.svg
-		matches = [s for s in iconList if "/" + name + "." in s or "/" + name + "-" in s]
-		if len(matches) > 0:
-			matches.sort(key=len)
-			return matches[0]
-	return ""
+def exec_program(cmd): # the program an Exec line runs, quoted paths and "env VAR=x prog" included
+	try:
+		args = shlex.split(cmd)
+	except ValueError: # unbalanced quotes
+		args = cmd.split()
+	if len(args) > 0 and os.path.basename(args[0]) == "env":
+		args = args[1:]
+		while len(args) > 0 and (args[0].startswith("-") or "=" in args[0]):
+			args = args[2:] if args[0] in ("-u", "-C", "--unset", "--chdir") else args[1:]
+	# "flatpak run app.id" needs flatpak itself, the app is there as long as its exported .desktop file is
+	if len(args) < 1:
+		return ""
+	return args[0]
+
+def strip_field_code(data):
+	if len(data) > 3 and data[-2] == '%': # get rid of filemanager arguments in dt files
+		data = data[:-2].strip()
+	return data
+
+class dtItem(object): # compact record of the [Desktop Entry] keys the menu uses
+	__slots__ = ("fileName", "Name", "Comment", "Exec", "Terminal", "Type", "Icon", "IconName", "ExecProgram", "ExecPath",
+		"Categories", "TryExec", "NoDisplay", "OnlyShowIn", "NotShowIn", "Shown", "Actions",
+		"GenericName", "Keywords")
+	cached = __slots__[1:] # fields kept in the desktop cache
 
-class dtItem(object):
 	def __init__(self, fName):
 		self.fileName = fName
 		self.Name = ""
@@ -129,24 +802,44 @@ class dtItem(object):
 		self.Terminal = None
 		self.Type = ""
 		self.Icon = ""
+		self.IconName = ""
+		self.ExecProgram = ""
+		self.ExecPath = None
 		self.Categories = ()
+		self.TryExec = ""
+		self.NoDisplay = False # NoDisplay or Hidden
+		self.OnlyShowIn = ()
+		self.NotShowIn = ()
+		self.Shown = False # passed every check and has its icon resolved
+		self.Actions = [] # [[name, exec], ...] of the [Desktop Action] groups, in the order of the Actions key
+		self.GenericName = "" # GenericName and Keywords only feed the search index
+		self.Keywords = []
+
+	def fields(self):
+		return {key: getattr(self, key) for key in self.cached}
 
-	def addName(self, data):
-		self.Name = xescape(data)
+	def shown(self): # NoDisplay, Hidden, OnlyShowIn and NotShowIn, checked before any icon lookup
+		if self.NoDisplay or self.Type != "Application":
+			return False
+		if self.OnlyShowIn and not any(d in current_desktops for d in self.OnlyShowIn):
+			return False
+		return not any(d in current_desktops for d in self.NotShowIn)
+
+	def addName(self, data): # escaped by MenuEmitter
+		self.Name = data
 
 	def addComment(self, data):
 		self.Comment = data
 
 	def addExec(self, data):
-		if len(data) > 3 and data[-2] == '%': # get rid of filemanager arguments in dt files
-			data = data[:-2].strip()
-		self.Exec = data
+		self.ExecProgram = exec_program(data)
+		self.Exec = strip_field_code(data)
 
 	def addIcon(self, data):
 		self.Icon = ""
+		self.IconName = data
 		if image_cat_prefix == "":
 			return
-		image_dir = image_dir_base[0] + "/pixmaps/"
 		di = data.strip()
 		if len(di) < 3:
 			#"Error in %s: Invalid or no icon '%s'" % (self.fileName,  di)
@@ -155,26 +848,8 @@ class dtItem(object):
 		if dix >= 0 and dix <= 2:    # yes, its a path (./path or ../path or /path ...)
 			self.Icon = di
 			return
-		#else a short name like "myapp"
-		tmp = glob.glob(image_dir + di + ".*")
-		if len(tmp) == 0: #if there is not correct icon in pixmap, check for icon theme
-			for theme in iconThemes:
-				tmp=[s for s in iconList if di in s] 
-				if len(tmp) > 0:
-					break # end loop if found
-				else:
-					addIconsToList(iconList, theme)
-		if len(tmp) == 1 and tmp[0] != "/":
-			self.Icon = tmp[0]
-		if len(tmp) > 1: # if there are duplicated icons take one that has the shortest name
-			temp=tmp[0] # assign first item to a temp path
-			flen=len(temp.split("/")[-1]) # split filepath with "/" and take last element of list
-			for fpath in tmp: # check filepath list for shortest filename
-				tlen=len(fpath.split("/")[-1]) # split filepath with / and take last element of list
-				if tlen<flen: # replace icon path with shorter filename path
-					flen=tlen # reallocate shortest filename length
-					temp=fpath # reallocate temp path
-			self.Icon = temp
+		#else a short name like "myapp", pixmaps first then icon themes
+		self.Icon = iconIndex.find(di)
 		return
 
 	def addTerminal(self, data):
@@ -207,291 +882,1078 @@ def getCatIcon(cat):
 		if cat == "applications-settings": cat = "preferences-desktop"
 	if theme == "Tango":
 		if cat == "applications-utilities": cat = "applications-accessories"
-	tmp = [s for s in iconList if cat in s]
-	if len(tmp) > 0:
-		return tmp[0]
-	return ""
+	return iconIndex.find(cat)
+
+#one pass over the string instead of one rebuild per escaped character
+xescape_table = str.maketrans({"&":"&amp;", "<":"&lt;", ">":"&gt;", "'":"&apos;", "\"":"&quot;"})
 
 def xescape(s):
-	Rep = {"&":"&amp;", "<":"&lt;", ">":"&gt;",  "'":"&apos;", "\"":"&quot;"}
-	for p in ("&", "<", ">",  "'","\""):
-		sl = len(s); last = -1
-		while last < sl:
-			i = s.find(p,  last+1)
-			if i < 0:
-				done = True
-				break
-			last = i
-			l = s[:i]
-			r = s[i+1:]
-			s = l + Rep[p] + r
-	return s
-
-def process_category(cat, curCats, aliases=group_aliases, appGroups=application_groups):
-	# first process aliases
-	if aliases.__contains__(cat):
-		if aliases[cat] == "":
-			return "" # ignore this one
-		cat = aliases[cat]
-	if cat in appGroups and cat not in curCats: # valid categories only and no doublettes, please
-		curCats.append(cat)
-		return cat
+	return s.translate(xescape_table)
+
+def cdata(s): # a CDATA section cannot contain "]]>", so it is split across two sections
+	return "<![CDATA[" + s.replace("]]>", "]]]]><![CDATA[>") + "]]>"
+
+def process_category(cat, curCats):
+	group = category_map.get(cat, "") # aliases first, then the groups themselves
+	if group != "" and group not in curCats: # valid categories only and no doublettes, please
+		curCats.append(group)
+		return group
 	return ""
 
-def process_dtfile(dtf,  catDict):  # process this file & extract relevant info
-	active = False          # parse only after "[Desktop Entry]" line         
-	fh = open(dtf,  "r")
-	lines = fh.readlines()
+#desktops named in $XDG_CURRENT_DESKTOP, matched against OnlyShowIn and NotShowIn
+current_desktops = [d for d in os.environ.get("XDG_CURRENT_DESKTOP", "").split(":") if d]
+
+def locale_keys(): # Name[xx] locales in the order the spec prefers them, e.g. de_DE@euro, de_DE, de@euro, de
+	value = ""
+	for var in ("LC_ALL", "LC_MESSAGES", "LANG"):
+		value = os.environ.get(var, "")
+		if value:
+			break
+	lang, _, modifier = value.partition("@")
+	language, _, country = lang.split(".", 1)[0].partition("_")
+	if language in ("", "C", "POSIX"):
+		return []
+	keys = []
+	if country and modifier:
+		keys.append(f"{language}_{country}@{modifier}")
+	if country:
+		keys.append(f"{language}_{country}")
+	if modifier:
+		keys.append(f"{language}@{modifier}")
+	keys.append(language)
+	return keys
+
+locale_rank = {key: rank for rank, key in enumerate(locale_keys())}
+
+localized_keys = ("Name", "GenericName", "Keywords", "Comment")
+
+value_escapes = {"s": " ", "n": "\n", "t": "\t", "r": "\r", "\\": "\\"}
+
+def unescape_value(s): # \s \n \t \r and \\ in string values
+	if "\\" not in s:
+		return s
+	out = []
+	i = 0
+	while i < len(s):
+		if s[i] == "\\" and i + 1 < len(s):
+			out.append(value_escapes.get(s[i+1], s[i:i+2]))
+			i += 2
+		else:
+			out.append(s[i])
+			i += 1
+	return "".join(out)
+
+def split_list(s): # "a;b;" -> ["a", "b"]
+	return [x for x in s.split(";") if x]
+
+def parse_dtfile(dtf):  # extract relevant info of this file, reading stops after the last group the menu uses
+	group = None            # None before "[Desktop Entry]", "" inside it, the action id inside [Desktop Action id]
 	this = dtItem(dtf)
-	for l in lines:
-		l = l.strip()
-		if l == "[Desktop Entry]":
-			active = True
+	ranks = {} # localized key -> locale rank of the value read so far
+	actionIds = []
+	actions = {} # action id -> [name, exec, name rank]
+	pending = set() # listed actions whose group was not read yet
+	with open(dtf, "r", encoding="utf-8") as fh:
+		for l in fh:
+			l = l.strip()
+			if len(l) < 1 or l[0] == '#':
+				continue
+			if l[0] == '[':
+				if group is None:
+					if l == "[Desktop Entry]":
+						group = ""
+					continue
+				group = l[16:-1] if l.startswith("[Desktop Action ") else "-"
+				if group in pending:
+					pending.discard(group)
+					continue
+				if not pending: # every listed action is read, the rest is nothing the menu uses
+					break
+				group = "-" # an action not listed in Actions, or some other group between them
+				continue
+			if group is None: # we don't care about licenses or other comments
+				continue
+			key, eq, value = l.partition('=')
+			if not eq:
+				continue
+			key = key.rstrip()
+			value = value.lstrip()
+			if group != "":
+				action = actions.get(group)
+				if action is None:
+					continue
+				if key == "Exec":
+					action[1] = strip_field_code(value)
+				elif key == "Name" and action[2] == len(locale_rank):
+					action[0] = unescape_value(value)
+				elif key[-1:] == "]":
+					key, _, locale = key[:-1].partition("[")
+					if key == "Name" and locale_rank.get(locale, action[2]) < action[2]:
+						action[0] = unescape_value(value)
+						action[2] = locale_rank[locale]
+				continue
+			if key[-1:] == "]": # localized key, only locales matching ours count
+				key, _, locale = key[:-1].partition("[")
+				rank = locale_rank.get(locale)
+			else:
+				rank = len(locale_rank) # the plain key ranks after every matching locale
+			if key in localized_keys:
+				if rank is None or rank > ranks.get(key, rank):
+					continue
+				ranks[key] = rank
+			elif rank != len(locale_rank):
+				continue
+			if key == "Name":
+				this.addName(unescape_value(value))
+			elif key == "GenericName":
+				this.GenericName = unescape_value(value)
+			elif key == "Keywords":
+				this.Keywords = split_list(unescape_value(value))
+			elif key == "Comment":
+				this.addComment(unescape_value(value))
+			elif key == "Exec":
+				this.addExec(value)
+			elif key == "TryExec":
+				this.TryExec = unescape_value(value)
+			elif key == "Icon":
+				this.IconName = unescape_value(value) # resolved once the entry is known to be shown
+			elif key == "Terminal":
+				this.addTerminal(value)
+			elif key == "Type":
+				this.addType(value)
+			elif key == "NoDisplay" or key == "Hidden":
+				this.NoDisplay = this.NoDisplay or value == "true"
+			elif key == "OnlyShowIn":
+				this.OnlyShowIn = split_list(value)
+			elif key == "NotShowIn":
+				this.NotShowIn = split_list(value)
+			elif key == "Actions":
+				actionIds = split_list(value)
+				actions = {actionId: ["", "", len(locale_rank)] for actionId in actionIds}
+				pending = set(actionIds)
+			elif key == "Categories":
+				cats = []
+				for cat in split_list(value) or ["Other"]:
+					process_category(cat,  cats)
+				this.addCategories(cats)
+	# actions without a name or command are invalid and skipped, like the spec asks
+	this.Actions = [actions[a][:2] for a in actionIds if a in actions and actions[a][0] and actions[a][1]]
+	return this
+
+def prepare_dtfile(dtf):  # parse this file only if it changed since the last run, then check Exec and resolve the icon
+	try:
+		st = os.stat(dtf)
+	except OSError:
+		return None
+	fields = desktopCache.get(dtf, st)
+	if fields is None:
+		try:
+			this = parse_dtfile(dtf)
+		except (OSError, UnicodeDecodeError):
+			return None
+		resolved = False
+	else:
+		this = dtItem(dtf)
+		for key, value in fields.items():
+			setattr(this, key, value)
+		resolved = desktopCache.iconsValid and this.Shown
+	this.Shown = False
+	if not this.shown() or len(this.Categories) == 0: # hidden entries cost no $PATH or icon lookups
+		return st, this
+	if this.TryExec != "" and which(this.TryExec) is None:
+		return st, this
+	if this.Exec != "": # desktop item ignored if Exec command not found in system
+		this.ExecPath = which(this.ExecProgram)
+		if this.ExecPath is None:
+			return st, this
+	if not resolved:
+		this.addIcon(this.IconName)
+	this.Shown = True
+	return st, this
+
+def needs_prepare(dtf): # would prepare_dtfile have to parse or resolve icons?
+	try:
+		st = os.stat(dtf)
+	except OSError:
+		return False
+	return not desktopCache.iconsValid or desktopCache.get(dtf, st) is None
+
+def process_dtfile(dtf,  catDict, prepared=None):  # process this file & extract relevant info
+	if prepared is None:
+		prepared = prepare_dtfile(dtf)
+	if prepared is None:
+		return
+	st, this = prepared
+	desktopCache.put(dtf, st, this.fields())
+	if this.Shown:
+		for cat in this.Categories:
+			catDict[cat].append(this)
+
+def desktop_files(appDir, prefix, found): # desktop file ID -> path, "kde/foo.desktop" has the ID "kde-foo.desktop"
+	try:
+		with os.scandir(appDir) as it:
+			entries = sorted(it, key=lambda x: x.name)
+	except OSError:
+		return
+	for entry in entries:
+		if entry.name.endswith(".desktop"):
+			found.setdefault(prefix + entry.name, entry.path) # an ID seen in an earlier data dir shadows this one
+		elif entry.is_dir(follow_symlinks=False):
+			desktop_files(entry.path, prefix + entry.name + "-", found)
+
+def find_dtfiles():
+	found = {}
+	for appDir in applications_dirs:
+		desktop_files(appDir, "", found)
+	dtFiles = list(found.values())
+	if ignore_matcher is None:
+		return dtFiles
+	return [dtf for dtf in dtFiles if not ignore_matcher.search(dtf)]
+
+def scan_applications(jobs=1):
+	pathIndex.refresh()
+	catDict = {}
+	for appGroup in application_groups:
+		catDict[appGroup] = []
+	dtFiles = find_dtfiles()
+	prepared = {}
+	if jobs > 1:
+		# workers are forked, so they share the loaded caches and icon index. results are
+		# merged in dtFiles order below, which keeps the output identical to a serial run
+		todo = [dtf for dtf in dtFiles if needs_prepare(dtf)]
+		if len(todo) > 1:
+			import multiprocessing
+			with multiprocessing.get_context("fork").Pool(min(jobs, len(todo))) as pool:
+				prepared = dict(zip(todo, pool.map(prepare_dtfile, todo, chunksize=max(1, len(todo) // (jobs * 4)))))
+	for dtf in dtFiles:
+		if dtf in prepared:
+			process_dtfile(dtf,  catDict, prepared[dtf])
+		else:
+			process_dtfile(dtf,  catDict)
+	return catDict
+
+#one emitter for static menus and pipe menus, the document is built in a single buffer
+class MenuEmitter(object):
+	def __init__(self, is_static):
+		self.is_static = is_static
+		self.depth = 2 # indentation of static menus, root-menu content starts at two levels
+		self.out = []
+
+	def begin(self):
+		if self.is_static:
+			self.out.append('<?xml version="1.0" encoding="UTF-8"?>\n<openbox_menu >\n    <menu id="root-menu" label="Applications">\n')
+		else:
+			self.out.append("<openbox_pipe_menu>\n") # this is enough
+
+	def end(self):
+		if self.is_static:
+			self.out.append('    </menu>\n</openbox_menu>\n')
+		else:
+			self.out.append("</openbox_pipe_menu>\n")
+
+	def startMenu(self, menuId, label, icon):
+		menuId, label, icon = xescape(menuId), xescape(label), xescape(menu_icon(icon) or "")
+		if self.is_static:
+			line = f'{"    " * self.depth}<menu id="{menuId}" label="{label}"'
+		else:
+			line = f'<menu id="openbox-{menuId}" label="{label}"'
+		if icon:
+			line += f' icon="{icon}"'
+		self.out.append(line + ">\n")
+		self.depth += 1
+
+	def endMenu(self, menuId):
+		self.depth -= 1
+		if self.is_static:
+			self.out.append(f'{"    " * self.depth}</menu> <!-- {menuId.replace("--", "- -")} -->\n')
+		else:
+			self.out.append("</menu>\n")
+
+	def pipeMenu(self, menuId, label, icon, command): # a submenu labwc fills by running command
+		menuId, label, icon = xescape(menuId), xescape(label), xescape(menu_icon(icon) or "")
+		if self.is_static:
+			line = f'{"    " * self.depth}<menu id="{menuId}" label="{label}"'
+		else:
+			line = f'<menu id="openbox-{menuId}" label="{label}"'
+		if icon:
+			line += f' icon="{icon}"'
+		self.out.append(line + f' execute="{xescape(command)}" />\n')
+
+	def separator(self, label=None):
+		line = f'<separator label="{xescape(label)}" />' if label else "<separator />"
+		if self.is_static:
+			self.out.append(f'{"    " * self.depth}{line}\n')
+		else:
+			self.out.append(line + "\n")
+
+	def item(self, label, icon, action, command): # label, icon and command are raw strings
+		line = f'<item label="{xescape(label)}"'
+		if icon:
+			line += f' icon="{xescape(menu_icon(icon))}"'
+		line += ">"
+		if not self.is_static:
+			line += f'<action name="{action}">'
+			if command:
+				line += f'<command>{cdata(command)}</command>'
+			self.out.append(line + '</action></item>\n')
+			return
+		indent = "    " * self.depth
+		self.out.append(f'{indent}{line}\n{indent}    <action name="{action}">\n')
+		if command:
+			self.out.append(f'{indent}        <command>{xescape(command)}</command>\n')
+		self.out.append(f'{indent}    </action>\n{indent}</item>\n')
+
+	def extend(self, text): # a menu rendered earlier with another emitter
+		self.out.append(text)
+
+	def text(self):
+		return "".join(self.out)
+
+def render_footer(emitter, icons=None):
+	if icons is None:
+		icons = [iconIndex.findAny(item["icons"]) for item in footer_items]
+	emitter.separator()
+	for item, iconPath in zip(footer_items, icons):
+		emitter.item(item["label"], iconPath, item["action"], item["cmd"])
+
+def app_label(app):
+	return ' '.join([word[:1].upper()+word[1:] for word in app.Name.split(' ')])
+
+def app_command(app):
+	if app.Terminal:
+		return f"{terminal_string} {app.Exec}"
+	return app.Exec
+
+def render_app(emitter, label, app, groupName):
+	cmdString = app_command(app)
+	desktopId = os.path.basename(app.fileName)
+	if not show_actions or not app.Actions:
+		emitter.item(label, app.Icon, "Execute", launch_command(desktopId, cmdString))
+		return
+	# a submenu with the app itself first, then its actions. the id has to be unique across categories
+	menuId = f"{groupName}-{os.path.basename(app.fileName)}"
+	emitter.startMenu(menuId, label, app.Icon)
+	emitter.item(label, app.Icon, "Execute", launch_command(desktopId, cmdString))
+	emitter.separator()
+	for actionName, actionExec in app.Actions:
+		if app.Terminal:
+			actionExec = f"{terminal_string} {actionExec}"
+		emitter.item(actionName, app.Icon, "Execute", launch_command(desktopId, actionExec))
+	emitter.endMenu(menuId)
+
+def render_items(emitter, catList, groupName):
+	tmpList=[] 
+	for app in catList: 
+		tmpList.append([app_label(app), app]) 
+	catList=sorted(tmpList, key = lambda x: x[0].lower()) 
+	
+	for label, app in catList:
+		render_app(emitter, label, app, groupName)
+
+def render_category(groupName, catList, is_static):
+	emitter = MenuEmitter(is_static)
+	emitter.startMenu(groupName, groupName, getCatIcon(groupName))
+	render_items(emitter, catList, groupName)
+	emitter.endMenu(groupName)
+	return emitter.text()
+
+def render_category_menu(catDict, groupName): # pipe menu of a single category (--category)
+	emitter = MenuEmitter(False)
+	emitter.begin()
+	render_items(emitter, catDict.get(groupName, []), groupName)
+	emitter.end()
+	return emitter.text()
+
+config_arg = None # --config and --data-dirs of this run, the category pipe menus must read the same files
+data_dirs_arg = None
+
+def category_command(groupName, jobs): # pipe menu command of a category in --lazy root menus
+	cmd = ["python3", os.path.abspath(sys.argv[0]), "--category", groupName, "--icon-size", str(icon_size)]
+	if config_arg:
+		cmd += ["--config", config_arg]
+	if data_dirs_arg:
+		cmd += ["--data-dirs", data_dirs_arg]
+	if jobs > 1:
+		cmd += ["--jobs", str(jobs)]
+	if show_actions:
+		cmd.append("--actions")
+	if frequent_count > 0:
+		cmd += ["--frequent", str(frequent_count)]
+	if iconRaster is not None:
+		cmd.append("--raster-icons")
+	return " ".join(shlex.quote(x) for x in cmd)
+
+def render_lazy_menu(summary, is_static, show_footer, jobs): # root menu with a pipe menu per category
+	emitter = MenuEmitter(is_static)
+	emitter.begin()
+	if frequent_count > 0: # ranked now, from the apps of the last scan that were ever launched
+		scores = frecency_scores()
+		apps = summary["frequent"]
+		top = sorted((x for x in apps if x in scores), key=lambda desktopId: (-scores[desktopId], desktopId))[:frequent_count]
+		if top:
+			emitter.separator("Frequent")
+			for desktopId in top:
+				label, icon, cmd = apps[desktopId]
+				emitter.item(label, icon, "Execute", launch_command(desktopId, cmd))
+			emitter.separator()
+	for groupName, groupIcon in summary["categories"]:
+		emitter.pipeMenu(groupName, groupName, groupIcon, category_command(groupName, jobs))
+	if show_footer:
+		render_footer(emitter, summary["footer"])
+	emitter.end()
+	return emitter.text()
+
+#categories and footer icons of the last full scan, enough to draw a --lazy root menu without scanning.
+#with --frequent also label, icon and command of every app in the launch log, the category pipe menus
+#scan too, so opening one brings in apps launched for the first time
+summary_file = cache_dir + "/summary.json"
+
+def load_summary():
+	try:
+		with open(summary_file, "r") as f:
+			summary = json.load(f)
+		if (summary["size"] == icon_size and summary["config"] == config_stamp and len(summary["footer"]) == len(footer_items)
+			and (summary.get("frequent") is None) == (frequent_count < 1)):
+			return summary
+	except (OSError, ValueError, KeyError, TypeError):
+		pass
+	return None
+
+def save_summary(catDict):
+	summary = {"size": icon_size,
+		"categories": [[groupName, getCatIcon(groupName)] for groupName in application_groups if len(catDict[groupName]) > 0],
+		"footer": [iconIndex.findAny(item["icons"]) for item in footer_items], "config": config_stamp, "frequent": None}
+	if frequent_count > 0:
+		scores = frecency_scores()
+		summary["frequent"] = {os.path.basename(app.fileName): [app_label(app), app.Icon, app_command(app)]
+			for catList in catDict.values() for app in catList if os.path.basename(app.fileName) in scores}
+	if load_summary() == summary:
+		return summary
+	tmp = summary_file + ".tmp"
+	try:
+		os.makedirs(cache_dir, exist_ok=True)
+		with open(tmp, "w") as f:
+			json.dump(summary, f, separators=(",", ":"))
+		os.replace(tmp, summary_file)
+	except OSError:
+		pass
+	return summary
+
+#launches through --launch, one "time<TAB>desktop file<TAB>weight" line each. the log is only appended to,
+#until it grows past launch_log_limit lines and is folded into one line per app with its decayed weight
+launch_log = cache_dir + "/launches.log"
+launch_log_limit = 1000
+frequent_count = 0 # apps in the Frequent section, 0 also leaves item commands unwrapped, set by --frequent
+frecency_half_life = 14 * 86400 # a launch weighs half as much two weeks later
+
+def launch_command(desktopId, cmd): # cmd run through --launch, so the launch ends up in the log
+	if frequent_count < 1:
+		return cmd
+	return f"python3 {shlex.quote(os.path.abspath(sys.argv[0]))} --launch {shlex.quote(desktopId)} {cmd}"
+
+def launch(desktopId, cmd): # --launch: log the launch, then become the program
+	log_launch(desktopId)
+	os.execvp(cmd[0], cmd)
+
+def log_launch(desktopId):
+	line = f"{int(time.time())}\t{desktopId}\t1\n".encode()
+	try:
+		os.makedirs(cache_dir, exist_ok=True)
+		for attempt in range(3):
+			fd = os.open(launch_log, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o600)
+			try:
+				fcntl.flock(fd, fcntl.LOCK_EX)
+				if os.fstat(fd).st_ino == os.stat(launch_log).st_ino: # not replaced by a compaction meanwhile
+					os.write(fd, line)
+					break
+			finally:
+				os.close(fd)
+	except OSError:
+		pass
+
+def read_launch_log(f, now): # desktop file -> decayed weight, bad lines (a torn last write) are skipped
+	scores = {}
+	for line in f:
+		fields = line.split("\t")
+		if len(fields) != 3:
 			continue
-		if active == False: # we don't care about licenses or other comments
+		try:
+			weight = float(fields[2]) * 0.5 ** ((now - int(fields[0])) / frecency_half_life)
+		except ValueError:
 			continue
-		if l == None or len(l) < 1 or l[0] == '#':
+		scores[fields[1]] = scores.get(fields[1], 0.0) + weight
+	return scores
+
+def frecency_scores():
+	now = time.time()
+	try:
+		with open(launch_log, "r") as f:
+			lines = f.readlines()
+	except OSError:
+		return {}
+	scores = read_launch_log(lines, now)
+	if len(lines) <= launch_log_limit:
+		return scores
+	try:
+		with open(launch_log, "r") as f:
+			fcntl.flock(f, fcntl.LOCK_EX) # launches wait, then notice the new file
+			if os.fstat(f.fileno()).st_ino != os.stat(launch_log).st_ino: # another menu compacted it first
+				return scores
+			scores = read_launch_log(f, now)
+			scores = {desktopId: score for desktopId, score in scores.items() if score >= 0.01}
+			tmp = launch_log + ".tmp"
+			with open(tmp, "w") as out:
+				out.writelines(f"{int(now)}\t{desktopId}\t{score:.4f}\n" for desktopId, score in scores.items())
+			os.replace(tmp, launch_log)
+	except OSError:
+		pass
+	return scores
+
+def render_frequent(emitter, catDict): # the most launched apps, ahead of the categories
+	scores = frecency_scores()
+	apps = {}
+	for catList in catDict.values():
+		for app in catList:
+			desktopId = os.path.basename(app.fileName)
+			if desktopId in scores:
+				apps[desktopId] = app
+	top = sorted(apps, key=lambda desktopId: (-scores[desktopId], desktopId))[:frequent_count]
+	if not top:
+		return
+	emitter.separator("Frequent")
+	for desktopId in top:
+		render_app(emitter, app_label(apps[desktopId]), apps[desktopId], "Frequent")
+	emitter.separator()
+
+#apps of the last scan for launchers (--search-index), written only when they change.
+#lower and trigrams are precomputed, so a launcher matches without touching a single .desktop file
+search_index = None # path, set by --search-index
+search_index_default = cache_dir + "/search.json"
+
+def trigrams(text): # of each word, words shorter than three letters are kept whole
+	grams = set()
+	for word in text.split():
+		if len(word) < 3:
+			grams.add(word)
+		for i in range(len(word) - 2):
+			grams.add(word[i:i+3])
+	return sorted(grams)
+
+def write_search_index(catDict, path):
+	apps = {}
+	for catList in catDict.values():
+		for app in catList:
+			apps[app.fileName] = app
+	entries = []
+	for app in sorted(apps.values(), key=lambda app: app.Name.lower()):
+		cmdString = app.Exec
+		if app.Terminal:
+			cmdString = f"{terminal_string} {cmdString}"
+		lower = " ".join([x for x in [app.Name, app.GenericName] + app.Keywords if x]).lower()
+		entries.append({"id": os.path.basename(app.fileName), "name": app_label(app), "generic": app.GenericName,
+			"keywords": app.Keywords, "exec": cmdString, "icon": menu_icon(app.Icon),
+			"lower": lower, "trigrams": trigrams(lower)})
+	data = json.dumps({"version": 1, "apps": entries}, separators=(",", ":"), ensure_ascii=False)
+	try:
+		with open(path, "r", encoding="utf-8") as f:
+			if f.read() == data:
+				return
+	except OSError:
+		pass
+	tmp = path + ".tmp"
+	try:
+		os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+		with open(tmp, "w", encoding="utf-8") as f:
+			f.write(data)
+		os.replace(tmp, path)
+	except OSError as e:
+		print(f"Error writing search index {path}: {e}", file=sys.stderr)
+
+def search_index_stale(path): # an applications dir (or subdir) changed after the index was written
+	try:
+		indexTime = os.stat(path).st_mtime_ns
+	except OSError:
+		return True
+	for appDir in applications_dirs:
+		for dirPath, dirNames, fileNames in os.walk(appDir):
+			try:
+				if os.stat(dirPath).st_mtime_ns > indexTime:
+					return True
+			except OSError:
+				pass
+	return False
+
+def rofi_mode(path): # rofi script mode (-modi "apps:menu-generator.py --rofi"), one read of the search index
+	if os.environ.get("ROFI_RETV", "0") != "0": # an entry was picked, ROFI_INFO is "desktop file<TAB>command"
+		desktopId, _, cmd = os.environ.get("ROFI_INFO", "").partition("\t")
+		if cmd:
+			log_launch(desktopId)
+			subprocess.Popen(shlex.split(cmd), start_new_session=True,
+				stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+		return
+	if search_index_stale(path): # apps installed since the last scan, or no index yet
+		subprocess.run([sys.executable, os.path.abspath(sys.argv[0]), "--search-index", path, "--no-reconfigure"],
+			stdout=subprocess.DEVNULL)
+		try:
+			os.utime(path) # the index is only rewritten when apps changed, it is fresh either way
+		except OSError:
+			pass
+	try:
+		with open(path, "r", encoding="utf-8") as f:
+			apps = json.load(f)["apps"]
+	except (OSError, ValueError, KeyError):
+		print("\0message\x1fNo search index yet, run menu-generator.py --search-index")
+		return
+	out = ["\0no-custom\x1ftrue\n"]
+	for app in apps:
+		row = f"{app['name']}\0info\x1f{app['id']}\t{app['exec']}\x1fmeta\x1f{app['lower']}"
+		if app["icon"]:
+			row += f"\x1ficon\x1f{app['icon']}"
+		out.append(row.replace("\n", " ") + "\n")
+	sys.stdout.write("".join(out))
+
+def render_menu(catDict, is_static, show_footer, rendered=None):
+	# rendered keeps category menus between runs of --watch, only changed categories are rendered again
+	emitter = MenuEmitter(is_static)
+	emitter.begin()
+	if frequent_count > 0:
+		render_frequent(emitter, catDict)
+
+	for groupName in application_groups:
+		catList = catDict[groupName]
+		if len(catList) < 1:
+			continue 
+		if rendered is None:
+			emitter.extend(render_category(groupName, catList, is_static))
 			continue
-		if l[0] == '[' and l !=  "[Desktop Entry]":
-			active = False
+		key = [(app.fileName, app.Name, app.Icon, app.Terminal, app.Exec, app.Actions) for app in catList]
+		cached = rendered.get(groupName)
+		if cached is None or cached[0] != key:
+			cached = rendered[groupName] = (key, render_category(groupName, catList, is_static))
+		emitter.extend(cached[1])
+
+	# --- CUSTOM FOOTER ---
+	if show_footer:
+		render_footer(emitter)
+
+	emitter.end()
+	return emitter.text()
+
+def menu_model(data): # {menu id: (label, icon, execute, {(item label, nth with that label): entry})}, None if data is no menu
+	try:
+		root = ET.fromstring(data)
+	except ET.ParseError:
+		return None
+	model = {}
+	def walk(elem, menuId):
+		items = model[menuId][3]
+		for child in elem:
+			if child.tag == "menu":
+				childId = child.get("id") or child.get("label", "")
+				model[childId] = (child.get("label", childId), child.get("icon"), child.get("execute"), {})
+				walk(child, childId)
+			elif child.tag in ("item", "separator"):
+				label = child.get("label", "")
+				nth = 0
+				while (label, nth) in items: # items may share a label, e.g. two "Terminal" entries
+					nth += 1
+				action = child.find("action")
+				if child.tag == "separator":
+					items[(label, nth)] = ("separator",)
+				elif action is None:
+					items[(label, nth)] = (child.get("icon"), None, None)
+				else:
+					items[(label, nth)] = (child.get("icon"), action.get("name"), action.findtext("command"))
+	model[""] = ("(top level)", None, None, {})
+	walk(root, "")
+	return model
+
+def menu_changes(oldModel, newModel): # lines describing what changed between two menu models
+	changes = []
+	for menu in sorted(set(oldModel) | set(newModel)):
+		if menu not in oldModel:
+			changes.append(f"+ {newModel[menu][0]} ({len(newModel[menu][3])} items)")
 			continue
-		eqi = l.split('=',1)
-		if len(eqi) < 2:
+		if menu not in newModel:
+			changes.append(f"- {oldModel[menu][0]}")
 			continue
-		if eqi[0] == "Name":
-			this.addName(eqi[1])
-		elif eqi[0] == "Comment":
-			this.addComment(eqi[1])
-		elif eqi[0] == "Exec":
-			eqx=eqi[1].split(" ", 1)[0] 
-			if which(eqx) == None: 
-				return 
-			this.addExec(eqi[1]) 
-		elif eqi[0] == "Icon":
-			this.addIcon(eqi[1])
-		elif eqi[0] == "Terminal":
-			this.addTerminal(eqi[1])
-		elif eqi[0] == "Type":
-			if eqi[1] != "Application":
-				continue
-			this.addType(eqi[1])
-		elif eqi[0] == "Categories":
-			if eqi[1] == '':
-				eqi[1] = "Other"
-			if eqi[1][-1] == ';':
-				eqi[1] = eqi[1][0:-1]
-			cats = []
-			dtCats = eqi[1].split(';')
-			for cat in dtCats:
-				result = process_category(cat,  cats)
-			this.addCategories(cats)
+		name = newModel[menu][0]
+		if oldModel[menu][:3] != newModel[menu][:3]: # label, icon or pipe menu command
+			changes.append(f"~ {name}")
+		old, new = oldModel[menu][3], newModel[menu][3]
+		for item in sorted(set(old) | set(new)):
+			label = item[0] + (f" #{item[1] + 1}" if item[1] else "")
+			if item not in old:
+				changes.append(f"+ {name}: {label}")
+			elif item not in new:
+				changes.append(f"- {name}: {label}")
+			elif old[item] != new[item]:
+				changes.append(f"~ {name}: {label}")
+	return changes
+
+def write_menu(path, data): # atomic write, True only if the menu entries changed, None on errors
+	path = os.path.realpath(path) # a symlinked menu.xml stays a symlink
+	try:
+		with open(path, "rb") as f:
+			old = f.read()
+	except OSError:
+		old = None
+	if old is not None and hashlib.sha256(old).digest() == hashlib.sha256(data.encode()).digest():
+		return False
+	tmp = path + ".tmp"
+	try:
+		with open(tmp, 'w') as output_handle:
+			output_handle.write(data)
+		os.replace(tmp, path) # labwc never sees a half-written menu
+	except OSError as e:
+		print(f"Error writing output file: {e}", file=sys.stderr)
+		return None
+	oldModel = menu_model(old) if old is not None else None
+	if oldModel is None:
+		return True
+	changes = menu_changes(oldModel, menu_model(data))
+	for line in changes:
+		print(line, file=sys.stderr)
+	return len(changes) > 0 # formatting-only changes need no reload
+
+#wall time, peak rss and read/write syscalls per phase of a run (--profile)
+class Profiler(object):
+	def __init__(self, enabled):
+		self.enabled = enabled
+		self.last = time.perf_counter()
+		self.lastIo = self.ioSyscalls()
+
+	def ioSyscalls(self):
+		try:
+			with open("/proc/self/io", "r") as f:
+				return sum(int(l.split(":")[1]) for l in f if l.startswith(("syscr", "syscw")))
+		except (OSError, ValueError, IndexError):
+			return 0
+
+	def mark(self, phase):
+		if not self.enabled:
+			return
+		import resource
+		now = time.perf_counter()
+		io = self.ioSyscalls()
+		rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+		print(f"profile: {phase} {(now - self.last) * 1000:.2f} ms, peak rss {rss} KiB, {io - self.lastIo} io syscalls", file=sys.stderr)
+		# the report itself is not counted
+		self.last = time.perf_counter()
+		self.lastIo = self.ioSyscalls()
+
+def emit_menu(output, content, reconfigure=True): # static file (-o) or pipe menu on stdout
+	if output:
+		written = write_menu(output, content)
+		if written is None:
+			sys.exit(1)
+		# --- AUTO RECONFIGURE LABWC ---
+		if written and not reconfigure:
+			print("Menu written, labwc not reconfigured (--no-reconfigure).", file=sys.stderr)
+		elif written:
+			reconfigure_labwc()
 		else:
+			print("Menu entries unchanged, skipping labwc reconfigure.", file=sys.stderr)
+	else:
+		sys.stdout.write(content)
+
+#--batch: several menus from one scan, e.g. "output=~/.config/labwc/menu.xml,footer=false,size=32,theme=Papirus"
+output_spec_keys = ("output", "format", "footer", "terminal", "size", "theme")
+
+def parse_output_spec(spec, show_footer):
+	variant = {"output": None, "format": None, "footer": show_footer, "terminal": terminal_string, "size": icon_size, "theme": None}
+	for part in spec.split(","):
+		key, eq, value = part.partition("=")
+		key = key.strip()
+		if not eq or key not in output_spec_keys:
+			raise ValueError(f"'{part}' is not one of {'=, '.join(output_spec_keys)}=")
+		variant[key] = value.strip()
+	if not variant["output"]:
+		raise ValueError("output= is missing")
+	if variant["output"] != "-":
+		variant["output"] = os.path.expanduser(variant["output"])
+	if variant["format"] is None:
+		variant["format"] = "pipe" if variant["output"] == "-" else "static"
+	if variant["format"] not in ("static", "pipe"):
+		raise ValueError("format= is static or pipe")
+	if isinstance(variant["footer"], str):
+		variant["footer"] = variant["footer"].lower() in ("true", "1", "yes", "on", "t")
+	variant["size"] = int(variant["size"])
+	return variant
+
+def emit_variants(catDict, variants, reconfigure=True): # every variant from the one scan, icons resolved again only
+	global terminal_string, icon_size, iconRaster # for a theme or size not resolved yet
+	apps = {}
+	for catList in catDict.values():
+		for app in catList:
+			apps[app.fileName] = app
+	scanTheme, scanSize, scanTerminal = selected_theme, icon_size, terminal_string
+	current = (scanTheme, scanSize)
+	rasters = {icon_size: iconRaster} if iconRaster is not None else None
+	changed = False
+	for variant in variants:
+		wanted = (variant["theme"] or scanTheme, variant["size"])
+		if wanted != current:
+			icon_size = variant["size"]
+			load_icon_themes(wanted[0])
+			for app in apps.values():
+				app.addIcon(app.IconName)
+			current = wanted
+		if rasters is not None:
+			if icon_size not in rasters:
+				rasters[icon_size] = IconRaster(f"{cache_dir}/icons/{icon_size}", icon_size)
+			iconRaster = rasters[icon_size]
+		terminal_string = variant["terminal"]
+		content = render_menu(catDict, variant["format"] == "static", variant["footer"])
+		if variant["output"] == "-":
+			sys.stdout.write(content)
 			continue
-	if len(this.Categories) > 0:       
-		for cat in this.Categories:
-			catDict[cat].append(this)
+		written = write_menu(variant["output"], content)
+		if written is None:
+			sys.exit(1)
+		changed = changed or (written and variant["format"] == "static")
+	terminal_string = scanTerminal
+	if rasters is not None:
+		for raster in rasters.values():
+			raster.save()
+	if changed and reconfigure:
+		reconfigure_labwc()
+	elif changed:
+		print("Menus written, labwc not reconfigured (--no-reconfigure).", file=sys.stderr)
 
-addIconsToList(iconList, selected_theme) 
-categoryDict = {}
-
-def print_custom_footer(handle, is_static):
-	# Define custom items: [Label, ActionName, Command, PossibleIcons]
-	# Change this according to you
-	footer_items = [
-		{
-			"label": "Terminal", 
-			"action": "Execute", 
-			"cmd": "foot", 
-			"icons": ["terminal", "x-terminal-emulator", "org.gnome.Terminal"]
-		},
-		{
-			"label": "Reconfigure", 
-			"action": "Reconfigure", 
-			"cmd": None, 
-			"icons": ["system-reboot", "view-refresh", "reload"]
-		},
-		{
-			"label": "Proton VPN", 
-			"action": "Execute", 
-			"cmd": "protonvpn-app", 
-			"icons": ["proton-vpn-logo", "network-vpn", "nm-vpn-standalone-lock"]
-		},
-		{
-			"label": "Background", 
-			"action": "Execute", 
-			"cmd": f"sh -c '{userhome}/.config/rofi/wallselect/wallselect.sh'",
-			"icons": ["preferences-desktop-wallpaper", "wallpaper", "background"]
-		},
-		{
-			"label": "Exit", 
-			"action": "Exit", 
-			"cmd": None, 
-			"icons": ["system-log-out", "gnome-logout"]
-		}
-	]
-
-	# Print Separator
-	if is_static:
-		handle.write('        <separator />\n')
-	else:
-		print("<separator />")
+def reconfigure_labwc():
+	# Only run this if we generated a static file (otherwise it's an infinite loop in a pipe menu)
+	print("Attempting to reconfigure labwc...", file=sys.stderr)
+	try:
+		subprocess.run(["labwc", "--reconfigure"], check=False)
+		print("labwc reconfigured successfully.", file=sys.stderr)
+	except FileNotFoundError:
+		print("Warning: 'labwc' command not found. Skipping reconfigure.", file=sys.stderr)
+	except Exception as e:
+		print(f"Error reconfiguring labwc: {e}", file=sys.stderr)
 
-	# Print Items
-	for item in footer_items:
-		iconPath = find_best_icon(item["icons"])
-		
-		if is_static:
-			handle.write(f'        <item label="{item["label"]}"')
-			if iconPath:
-				handle.write(f' icon="{iconPath}"')
-			handle.write('>\n')
-			
-			handle.write(f'            <action name="{item["action"]}">\n')
-			if item["cmd"]:
-				escaped_cmd = xescape(item["cmd"])
-				handle.write(f'                <command>{escaped_cmd}</command>\n')
-			handle.write('            </action>\n')
-			handle.write('        </item>\n')
-		else:
-			# Pipe menu format
-			out = f'<item label="{item["label"]}"'
-			if iconPath:
-				out += f' icon="{iconPath}"'
-			out += f'><action name="{item["action"]}">'
-			if item["cmd"]:
-				out += f'<command><![CDATA[{item["cmd"]}]]></command>'
-			out += '</action></item>'
-			print(out)
+#minimal inotify binding, python has none in the standard library
+class Inotify(object):
+	IN_MODIFY = 0x2
+	IN_ATTRIB = 0x4
+	IN_CLOSE_WRITE = 0x8
+	IN_MOVED_FROM = 0x40
+	IN_MOVED_TO = 0x80
+	IN_CREATE = 0x100
+	IN_DELETE = 0x200
+	IN_Q_OVERFLOW = 0x4000
+	IN_IGNORED = 0x8000
+	IN_ISDIR = 0x40000000
+	IN_CHANGES = IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+
+	def __init__(self):
+		import ctypes, ctypes.util
+		self.ctypes = ctypes
+		self.libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+		self.fd = self.libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+		if self.fd < 0:
+			raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+		self.watches = {} # wd -> path
+
+	def add(self, path, mask=IN_CHANGES):
+		wd = self.libc.inotify_add_watch(self.fd, os.fsencode(path), mask)
+		if wd >= 0:
+			self.watches[wd] = path
+		return wd >= 0
+
+	def read(self): # [(watched path, name, mask)], "" as path on queue overflow
+		events = []
+		while True:
+			try:
+				data = os.read(self.fd, 65536)
+			except BlockingIOError:
+				return events
+			i = 0
+			while i + 16 <= len(data):
+				wd, mask, cookie, length = struct.unpack_from("iIII", data, i)
+				name = data[i+16:i+16+length].split(b"\0", 1)[0].decode(errors="replace")
+				i += 16 + length
+				if mask & self.IN_IGNORED:
+					self.watches.pop(wd, None)
+					continue
+				events.append((self.watches.get(wd, ""), name, mask))
+
+	def wait(self, debounce, limit=30): # block for an event, then collect the whole burst
+		select.select([self.fd], [], [])
+		events = self.read()
+		deadline = time.monotonic() + limit
+		while time.monotonic() < deadline and select.select([self.fd], [], [], debounce)[0]:
+			events += self.read()
+		return events
+
+def watch_paths(): # watched directory -> what to update when it changes
+	paths = {}
+	# installing icons rewrites icon-theme.cache or index.theme in the theme root,
+	# so watching theme roots is enough to see changed size/context directories
+	for base in icon_base_dirs:
+		paths[base] = "icons"
+		for theme in iconThemes:
+			paths[base + "/" + theme] = "icons"
+	for path in pixmap_dirs:
+		paths[path] = "icons"
+	paths[os.path.dirname(gtk3_config)] = "theme"
+	for appDir in applications_dirs:
+		paths[appDir] = "apps"
+		for dirPath, dirNames, fileNames in os.walk(appDir): # subdirs hold desktop file IDs like kde-foo.desktop
+			paths[dirPath] = "apps"
+	return paths
 
+def watch_menu(output, show_footer, debounce, jobs, reconfigure=True):
+	inotify = Inotify()
+	paths = watch_paths()
+	for path in paths:
+		inotify.add(path)
+	rendered = {}
+	last = None
+	while True:
+		categoryDict = scan_applications(jobs)
+		content = render_menu(categoryDict, True, show_footer, rendered)
+		save_summary(categoryDict)
+		if search_index:
+			write_search_index(categoryDict, search_index)
+		iconCache.save()
+		desktopCache.save()
+		pathIndex.save()
+		if iconRaster is not None:
+			iconRaster.save()
+		if content != last:
+			if write_menu(output, content) and reconfigure:
+				reconfigure_labwc() # once per burst
+			last = content
+		
+		events = inotify.wait(debounce)
+		kinds = set()
+		for path, name, mask in events:
+			kind = paths.get(path, "all")
+			if mask & Inotify.IN_Q_OVERFLOW:
+				kind = "all"
+			if kind == "theme" and name != os.path.basename(gtk3_config):
+				continue
+			if kind == "apps" and mask & Inotify.IN_ISDIR and mask & (Inotify.IN_CREATE | Inotify.IN_MOVED_TO):
+				for dirPath, dirNames, fileNames in os.walk(os.path.join(path, name)): # watched before the rescan reads it
+					paths[dirPath] = "apps"
+					inotify.add(dirPath)
+			kinds.add(kind)
+		if kinds & {"icons", "theme", "all"}:
+			load_icon_themes()
+			desktopCache.setIconStamp(iconCache.iconStamp(iconThemes, icon_size))
+			rendered.clear()
+			paths = watch_paths()
+			for path in paths:
+				inotify.add(path)
 
 if __name__ == "__main__":
+	if len(sys.argv) > 3 and sys.argv[1] == "--launch": # menu item commands, before any other work
+		launch(sys.argv[2], sys.argv[3:])
+	if len(sys.argv) > 1 and sys.argv[1] == "--rofi": # launcher, the search index is all it reads
+		rofi_mode(sys.argv[2] if len(sys.argv) > 2 else search_index_default)
+		sys.exit(0)
+
 	parser = argparse.ArgumentParser(
 		description="Generate Openbox/Labwc menus.\nTo Edit the footer open the code and edit footer_items according to you",
         formatter_class=argparse.RawTextHelpFormatter
 	)
 	parser.add_argument("-o", "--output", help="Path to output file for static menu generation.")
 	parser.add_argument("-f", "--footer", default="true", help="Show custom footer (true/false). Default: true")
+	parser.add_argument("-s", "--icon-size", type=int, default=icon_size, help=f"Pick icons closest to this size in pixels. Default: {icon_size}")
+	parser.add_argument("-w", "--watch", action="store_true", help="Keep running and regenerate the static menu (-o) when applications,\nicon themes or the GTK icon theme change.")
+	parser.add_argument("-j", "--jobs", type=int, default=1, help="Parse changed .desktop files with N worker processes. Default: 1")
+	parser.add_argument("-l", "--lazy", action="store_true", help="Root menu of per-category pipe menus, drawn from the last scan without scanning.")
+	parser.add_argument("-a", "--actions", action="store_true", help="Submenus for the Desktop Actions of apps (new window, private window ...).")
+	parser.add_argument("--frequent", type=int, default=0, help="Show the N most launched apps first. Items are then started through\n--launch DESKTOP-FILE COMMAND..., which logs each launch. Default: 0")
+	parser.add_argument("-c", "--category", help="Print the pipe menu of one category (used by --lazy menus).")
+	parser.add_argument("--raster-icons", action="store_true", help="Point the menu at copies of the icons rendered once at --icon-size,\ncached in ~/.cache/menu-generator/icons. Needs PyGObject, rsvg-convert or ImageMagick.")
+	parser.add_argument("--search-index", nargs="?", const=search_index_default, help="Also write the apps of the scan as a search index for launchers.\nDefault path: ~/.cache/menu-generator/search.json, read by --rofi [PATH]")
+	parser.add_argument("-b", "--batch", nargs="+", metavar="SPEC", help="Write several menus from one scan. SPEC is a comma separated list of\noutput=PATH (- for stdout), format=static|pipe, footer=true|false,\nterminal=CMD, size=N and theme=NAME. Unset keys follow the other options.")
+	parser.add_argument("--config", help="Settings file (TOML or JSON). Default: ~/.config/labwc/menu-generator.toml or .json")
+	parser.add_argument("--no-reconfigure", action="store_true", help="Write the static menu without reconfiguring labwc.")
+	parser.add_argument("--data-dirs", help="Colon separated system data dirs holding applications/ and icons/, used instead of\n$XDG_DATA_DIRS and the flatpak and snap exports. $XDG_DATA_HOME is always read first.")
+	parser.add_argument("--profile", action="store_true", help="Print wall time, peak RSS and I/O syscalls of each phase on stderr.")
+	parser.add_argument("--debounce", type=float, default=2.0, help="Seconds without changes before --watch regenerates. Default: 2")
 	args = parser.parse_args()
 
 	# Logic to convert string argument to boolean
 	show_footer = str(args.footer).lower() in ("true", "1", "yes", "on", "t")
 
+	if args.watch and not args.output:
+		parser.error("--watch needs --output")
+	if args.category and (args.output or args.watch):
+		parser.error("--category prints a pipe menu, it can't be used with --output or --watch")
+	if args.batch and (args.output or args.watch or args.category or args.lazy):
+		parser.error("--batch writes its own outputs, it can't be used with --output, --watch, --category or --lazy")
+
+	if args.config:
+		config_arg = os.path.abspath(args.config)
+	apply_config(load_config(config_arg))
 	application_groups=sorted(application_groups, key=str.lower)
-	for appGroup in application_groups:
-		categoryDict[appGroup] = []
-	
-	dtFiles=[]
-	for appDir in applications_dirs:
-		appDir += "/*.desktop"
-		dtFiles+=glob.glob(appDir)
-	
-	for dtf in dtFiles:
-		skipFlag = False
-		for ifn in ignoreList:
-			if dtf.find(ifn) >= 0:
-				skipFlag = True
-		if skipFlag == False:
-			process_dtfile(dtf,  categoryDict)
-
-	output_handle = sys.stdout
-	if args.output:
+	icon_size = args.icon_size
+	show_actions = args.actions
+	frequent_count = args.frequent
+	search_index = args.search_index
+	variants = []
+	for spec in args.batch or []:
 		try:
-			output_handle = open(args.output, 'w')
-		except IOError as e:
-			print(f"Error opening output file: {e}", file=sys.stderr)
-			sys.exit(1)
-	
-	if args.output:
-		output_handle.write('<?xml version="1.0" encoding="UTF-8"?>\n')
-		output_handle.write('<openbox_menu >\n')
-		output_handle.write('    <menu id="root-menu" label="Applications">\n')
-	else:
-		print ("<openbox_pipe_menu>") # this is enough
+			variants.append(parse_output_spec(spec, show_footer))
+		except ValueError as e:
+			parser.error(f"--batch {spec}: {e}")
+	if args.raster_icons:
+		iconRaster = IconRaster(f"{cache_dir}/icons/{icon_size}", icon_size)
+	if args.data_dirs:
+		data_dirs_arg = ":".join(os.path.abspath(x) for x in args.data_dirs.split(":") if x != "")
+		set_data_dirs([data_home] + [x for x in args.data_dirs.split(":") if x != ""])
+	profiler = Profiler(args.profile)
 
-	appGroupLen = len(application_groups)
-	
-	for ag in range(appGroupLen):
-		catList = categoryDict[application_groups[ag]]
-		if len(catList) < 1:
-			continue 
-		
-		tmpList=[] 
-		for app in catList: 
-			app.Name= ' '.join([word[0].upper()+word[1:] for word in app.Name.split(' ')]) 
-			tmpList.append([app.Name, [app.Icon, app.Terminal, app.Exec]]) 
-		catList=sorted(tmpList, key = lambda x: x[0].lower()) 
-		
-		groupName = application_groups[ag]
-		groupIcon = getCatIcon(groupName)
-		
-		if args.output:
-			menu_line = f'        <menu id="{groupName}" label="{groupName}"'
-			if groupIcon:
-				menu_line += f' icon="{groupIcon}"'
-			menu_line += ">"
-			output_handle.write(menu_line + "\n")
-
-			for app in catList:
-				appName = xescape(app[0])
-				appIcon = app[1][0]
-				isTerm = app[1][1]
-				appExec = app[1][2]
-				
-				cmdString = appExec
-				if isTerm:
-					cmdString = f"{terminal_string} {appExec}"
-				cmdString = xescape(cmdString)
-
-				item_line = f'            <item label="{appName}"'
-				if appIcon:
-					item_line += f' icon="{appIcon}"'
-				item_line += ">"
-				output_handle.write(item_line + "\n")
-				output_handle.write('                <action name="Execute">\n')
-				output_handle.write(f'                    <command>{cmdString}</command>\n')
-				output_handle.write('                </action>\n')
-				output_handle.write('            </item>\n')
-
-			output_handle.write(f'        </menu> <!-- {groupName} -->\n')
+	if args.lazy and not args.category and not args.watch and not search_index:
+		summary = load_summary()
+		if summary is not None: # first paint without any icon or .desktop scanning
+			emit_menu(args.output, render_lazy_menu(summary, bool(args.output), show_footer, args.jobs), not args.no_reconfigure)
+			if iconRaster is not None:
+				iconRaster.save()
+			profiler.mark("lazy")
+			sys.exit(0)
 
-		else:
-			catStr = "<menu id=\"openbox-%s\" label=\"%s\" " % (groupName, groupName)
-			if groupIcon != "":
-				catStr += "icon=\"%s\"" % groupIcon
-			print (catStr + ">")
-			for app in catList:
-				progStr = "<item "
-				progStr += "label=\"%s\" " % app[0] 
-				if app[1][0] != "": 
-					progStr += "icon=\"%s\" " % app[1][0] 
-				progStr += "><action name=\"Execute\"><command><![CDATA["
-				if app[1][1] == True:  
-					progStr += terminal_string + " "
-				progStr += "%s]]></command></action></item>"  % app[1][2] 
-				print (progStr)
-			print ("</menu>")
-
-	# --- PRINT CUSTOM FOOTER ---
-	if show_footer:
-		print_custom_footer(output_handle, args.output)
+	iconCache = IconCache(cache_dir + "/icons.json")
+	load_icon_themes()
+	profiler.mark("themes")
+	desktopCache = DesktopCache(cache_dir + "/desktop.json", iconCache.iconStamp(iconThemes, icon_size))
+	pathIndex = PathIndex(cache_dir + "/path.json")
+	profiler.mark("caches")
 
-	# WRITE FOOTERS
-	if args.output:
-		output_handle.write('    </menu>\n')
-		output_handle.write('</openbox_menu>\n')
-	else:
-		print ("</openbox_pipe_menu>") 
-		
-	if args.output and output_handle != sys.stdout:
-		output_handle.close()
-		
-		# --- AUTO RECONFIGURE LABWC ---
-		# Only run this if we generated a static file (otherwise it's an infinite loop in a pipe menu)
-		print("Attempting to reconfigure labwc...", file=sys.stderr)
+	if args.watch:
 		try:
-			subprocess.run(["labwc", "--reconfigure"], check=False)
-			print("labwc reconfigured successfully.", file=sys.stderr)
-		except FileNotFoundError:
-			print("Warning: 'labwc' command not found. Skipping reconfigure.", file=sys.stderr)
-		except Exception as e:
-			print(f"Error reconfiguring labwc: {e}", file=sys.stderr)
\ No newline at end of file
+			watch_menu(args.output, show_footer, args.debounce, args.jobs, not args.no_reconfigure)
+		except KeyboardInterrupt:
+			pass
+		sys.exit(0)
+
+	categoryDict = scan_applications(args.jobs)
+	profiler.mark("scan")
+	summary = save_summary(categoryDict)
+	if search_index:
+		write_search_index(categoryDict, search_index)
+	if variants:
+		emit_variants(categoryDict, variants, not args.no_reconfigure)
+		profiler.mark("batch")
+		content = None
+	elif args.category:
+		content = render_category_menu(categoryDict, args.category)
+	elif args.lazy:
+		content = render_lazy_menu(summary, bool(args.output), show_footer, args.jobs)
+	else:
+		content = render_menu(categoryDict, bool(args.output), show_footer)
+	if content is not None:
+		profiler.mark("render")
+		emit_menu(args.output, content, not args.no_reconfigure)
+		profiler.mark("write")
+
+	iconCache.save()
+	desktopCache.save()
+	pathIndex.save()
+	if iconRaster is not None:
+		iconRaster.save()
+	profiler.mark("save")
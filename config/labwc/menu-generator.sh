@@ -12,13 +12,13 @@ main_choice=$(echo -e "$main_options" | rofi -dmenu -mesg "<b>Footer in menu?</b
 # --- Handle the choice with a case statement ---
 case "$main_choice" in
 "Yes")
-    python3 "$menu_generator" -o "$menu_file"
+    python3 "$menu_generator" --search-index -o "$menu_file"
     # Notify user about menu generated sometimes it take few seccods to generate menu.
     notify-send "SUCCESS" "Desktop menu generated with Footer"
     ;;
 
 "No")
-    python3 "$menu_generator" -f false -o "$menu_file"
+    python3 "$menu_generator" -f false --search-index -o "$menu_file"
     # Notify user about menu generated
     notify-send "SUCCESS" "Desktop menu generated without Footer"
     ;;
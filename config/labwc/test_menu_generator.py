@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+#
+# Correctness tests for menu-generator.py: XML escaping of labels, ids and icons,
+# CDATA commands of pipe menus, and the static and pipe output of a real run.
+#
+# usage: python3 -m pytest test_menu_generator.py (or python3 test_menu_generator.py)
+
+import importlib.util, os, subprocess, sys, tempfile, unittest
+import xml.etree.ElementTree as ET
+
+generator = os.path.join(os.path.dirname(os.path.abspath(__file__)), "menu-generator.py")
+spec = importlib.util.spec_from_file_location("menu_generator", generator)
+mg = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(mg)
+
+tricky_label = 'Tom & "Jerry" <Edition>'
+tricky_command = "sh -c 'echo \"]]>\" > /dev/null; true'"
+
+class EscapeTest(unittest.TestCase):
+	def test_xescape_characters(self):
+		for raw, escaped in (("&", "&amp;"), ("<", "&lt;"), (">", "&gt;"), ("'", "&apos;"), ('"', "&quot;")):
+			self.assertEqual(mg.xescape(raw), escaped)
+			self.assertEqual(mg.xescape(f"a{raw}b"), f"a{escaped}b")
+
+	def test_xescape_plain(self):
+		self.assertEqual(mg.xescape("Firefox Web Browser"), "Firefox Web Browser")
+
+	def test_xescape_already_escaped(self): # input is raw text, an entity in it is shown as typed
+		self.assertEqual(mg.xescape("&amp;"), "&amp;amp;")
+		self.assertEqual(mg.xescape("&lt;b&gt;"), "&amp;lt;b&amp;gt;")
+		self.assertEqual(ET.fromstring(f'<item label="{mg.xescape("&amp;")}" />').get("label"), "&amp;")
+
+	def test_cdata(self):
+		self.assertEqual(mg.cdata("plain"), "<![CDATA[plain]]>")
+		wrapped = mg.cdata("a]]>b")
+		self.assertEqual(wrapped.count("]]>"), 2) # the split one and the closing one
+		self.assertEqual(ET.fromstring(f"<command>{wrapped}</command>").text, "a]]>b")
+
+class EmitterTest(unittest.TestCase):
+	def render(self, is_static):
+		emitter = mg.MenuEmitter(is_static)
+		emitter.begin()
+		emitter.startMenu("Tools & More", tricky_label, None)
+		emitter.item(tricky_label, None, "Execute", tricky_command)
+		emitter.endMenu("Tools & More")
+		emitter.separator(tricky_label)
+		emitter.end()
+		return ET.fromstring("".join(emitter.out).encode())
+
+	def check(self, root):
+		menu = [m for m in root.iter("menu") if m.get("label") == tricky_label][0]
+		self.assertEqual(menu.get("label"), tricky_label)
+		self.assertTrue(menu.get("id").endswith("Tools & More"))
+		item = menu.find("item")
+		self.assertEqual(item.get("label"), tricky_label)
+		self.assertEqual(item.find("action/command").text.strip(), tricky_command)
+		self.assertEqual(root.find(".//separator").get("label"), tricky_label)
+
+	def test_static(self):
+		self.check(self.render(True))
+
+	def test_pipe(self):
+		root = self.render(False)
+		self.assertEqual(root.tag, "openbox_pipe_menu")
+		self.check(root)
+
+class OutputTest(unittest.TestCase): # the whole generator against a tiny applications dir
+	def setUp(self):
+		self.tmp = tempfile.TemporaryDirectory()
+		base = self.tmp.name
+		os.makedirs(base + "/share/applications")
+		os.makedirs(base + "/share/icons/hicolor") # at least one icon theme has to be installed
+		os.makedirs(base + "/home")
+		with open(base + "/share/icons/hicolor/index.theme", "w") as f:
+			f.write("[Icon Theme]\nName=Hicolor\nDirectories=\n")
+		with open(base + "/share/applications/tricky.desktop", "w") as f:
+			f.write("[Desktop Entry]\nType=Application\n"
+				'Name=Tom & "Jerry" <Edition>\n'
+				f"Exec={tricky_command}\nCategories=Utility;\n")
+		self.env = dict(os.environ, HOME=base + "/home", XDG_CACHE_HOME=base + "/cache", XDG_CONFIG_HOME=base + "/config",
+			XDG_DATA_HOME=base + "/home/.local/share", XDG_CURRENT_DESKTOP="")
+		self.dataDirs = base + "/share"
+
+	def tearDown(self):
+		self.tmp.cleanup()
+
+	def run_generator(self, *extra):
+		return subprocess.run([sys.executable, generator, "--data-dirs", self.dataDirs, "--no-reconfigure", "--footer", "false"] + list(extra),
+			env=self.env, capture_output=True, text=True, check=True).stdout
+
+	def find_item(self, root):
+		for item in root.iter("item"):
+			if item.get("label") == tricky_label:
+				return item
+		self.fail("no item labelled " + tricky_label)
+
+	def test_static_output(self):
+		output = self.tmp.name + "/menu.xml"
+		self.run_generator("-o", output)
+		item = self.find_item(ET.parse(output).getroot())
+		self.assertEqual(item.find("action/command").text.strip(), tricky_command)
+
+	def test_pipe_output(self):
+		root = ET.fromstring(self.run_generator())
+		self.assertEqual(root.tag, "openbox_pipe_menu")
+		item = self.find_item(root)
+		self.assertEqual(item.find("action/command").text, tricky_command)
+
+if __name__ == "__main__":
+	unittest.main()
@@ -2,8 +2,19 @@
 
 dir="$HOME/.config/rofi/launchers/"
 theme='style-6'
+# apps are read from the search index of menu-generator.py --search-index instead of scanning again,
+# --rofi rescans by itself when applications were installed or removed since the index was written
+menu_generator="$HOME/.config/labwc/menu-generator.py"
 
 ## Run
-rofi \
-    -show drun \
-    -theme ${dir}/${theme}.rasi
+if [ -f "$menu_generator" ]; then
+    rofi \
+        -show apps \
+        -modi "apps:python3 '$menu_generator' --rofi" \
+        -show-icons \
+        -theme ${dir}/${theme}.rasi
+else
+    rofi \
+        -show drun \
+        -theme ${dir}/${theme}.rasi
+fi
@@ -8,15 +8,27 @@ import sys
 import re
 import subprocess
 import calendar
-from datetime import datetime
+import socket
+import struct
+import fnmatch
+import copy
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+try:
+    import sqlite3
+except ImportError:  # python built without sqlite, no history
+    sqlite3 = None
 
 # Configuration Paths
 config_dir = os.path.expanduser("~/.config/waybar/scripts/data_monitor")
 waybar_dir = os.path.dirname(os.path.dirname(config_dir))
 style_file = os.path.join(waybar_dir, "style.css")
 usage_file = os.path.join(config_dir, "usage.json")
+journal_file = os.path.join(config_dir, "usage.journal")
 config_file = os.path.join(config_dir, "config.json")
 pid_file = os.path.join(config_dir, "monitor.pid")
+history_file = os.path.join(config_dir, "history.db")
 
 # Icons
 icon_down = "󰇚"
@@ -61,6 +73,28 @@ default_config = {
     "reset_day": 30,
     "limit_monthly_gb": 800,
     "limit_daily_gb": 10,
+    "counter_backend": "sysfs",  # "sysfs" or "proc" (/proc/net/dev)
+    "interface_groups": {},  # interface name pattern -> group, "" to ignore, e.g. {"enx*": "tether"}
+    "counted_groups": [
+        "wifi",
+        "eth",
+        "mobile",
+        "tether",
+    ],  # groups in totals, limits and speed
+    "history": True,  # usage history in history.db, see --report
+    "history_minute_hours": 48,  # per-minute samples are kept this long
+    "history_hour_days": 730,  # hourly rollups are kept this long, daily ones forever
+    "sync_seconds": 10,  # changes are appended to usage.journal and fsynced this often
+    "checkpoint_minutes": 60,  # usage.json is rewritten this often and the journal emptied
+}
+
+# Tooltip names of the built-in groups, other groups from interface_groups show as they are
+group_labels = {
+    "wifi": "WiFi",
+    "eth": "Ethernet",
+    "mobile": "Mobile",
+    "tether": "Tethering",
+    "vpn": "VPN",
 }
 
 default_state = {
@@ -70,8 +104,8 @@ default_state = {
     "life_eth": 0,
     "daily_wifi": 0,
     "daily_eth": 0,
-    "last_proc_wifi": 0,
-    "last_proc_eth": 0,
+    "last_proc_ifaces": {},  # interface -> rx+tx bytes already counted
+    "iface_groups": {},  # interface -> group of the counted interfaces
     "last_reset_date": datetime.now().strftime("%Y-%m-%d"),
     "next_monthly_reset_date": "1970-01-01",
     "notified_daily_90": False,
@@ -80,6 +114,7 @@ default_state = {
     "notified_monthly_90": False,
     "notified_monthly_95": False,
     "notified_monthly_100": False,
+    "journal_seq": 0,  # last journal record included in usage.json
 }
 
 
@@ -115,27 +150,175 @@ def load_config():
             pass
 
 
+# Persistence: usage.json is a checkpoint, changes since then are appended to
+# usage.journal as one small record per sync_seconds: counter increases as deltas
+# under "+" (keyed by group when its daily, monthly and life counters grew alike),
+# the interface counters that moved under "i" (null when the interface is gone),
+# other changed keys with their new value under "=". The interface counter is left
+# out when it is the only interface of its group and grew by the group delta, so a
+# record is usually just {"s":seq,"+":{"wifi":bytes}}. Startup loads the checkpoint
+# and replays the records newer than its journal_seq, so a crash loses at most
+# sync_seconds of traffic and a checkpoint only rewrites usage.json every
+# checkpoint_minutes.
+journal_base = {}  # state as of the last journal record or checkpoint
+journal_size = 0
+last_checkpoint = 0.0
+counter_prefixes = ("daily_", "monthly_", "life_")
+
+
+# Signals are held while the journal or checkpoint is written, their handlers save too
+@contextmanager
+def deferred_signals():
+    signals = {signal.SIGINT, signal.SIGTERM, signal.SIGUSR1}
+    old = signal.pthread_sigmask(signal.SIG_BLOCK, signals)
+    try:
+        yield
+    finally:
+        signal.pthread_sigmask(signal.SIG_SETMASK, old)
+
+
 def load_state():
-    global state
-    if not os.path.exists(usage_file):
-        state = default_state.copy()
-        return
+    global state, journal_base, last_checkpoint
+    state = copy.deepcopy(default_state)
+    if os.path.exists(usage_file):
+        try:
+            with open(usage_file, "r") as f:
+                state.update(json.load(f))
+        except (json.JSONDecodeError, IOError):
+            pass
+    replay_journal()
+    journal_base = copy.deepcopy(state)
+    last_checkpoint = time.monotonic()
+
+
+def replay_journal():
+    global journal_size
+    journal_size = 0
     try:
-        with open(usage_file, "r") as f:
-            data = json.load(f)
-            state = {**default_state, **data}
-    except (json.JSONDecodeError, IOError):
-        state = default_state.copy()
+        with open(journal_file, "rb") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                    seq = record["s"]
+                except (ValueError, KeyError, TypeError):
+                    break  # torn write at the end, the rest is cut off below
+                journal_size += len(line)
+                if seq <= state["journal_seq"]:
+                    continue  # already in the checkpoint
+                state.update(record.get("=", {}))
+                ifaces = dict(state["last_proc_ifaces"])
+                for iface, value in record.get("i", {}).items():
+                    if value is None:
+                        ifaces.pop(iface, None)
+                    else:
+                        ifaces[iface] = value
+                for key, delta in record.get("+", {}).items():
+                    if key.startswith(counter_prefixes):
+                        state[key] = state.get(key, 0) + delta
+                        continue
+                    for period in counter_prefixes:
+                        state[period + key] = state.get(period + key, 0) + delta
+                    iface = sole_iface(key)
+                    if iface is not None and iface not in record.get("i", {}):
+                        ifaces[iface] = ifaces.get(iface, 0) + delta
+                state["last_proc_ifaces"] = ifaces
+                state["journal_seq"] = seq
+        if journal_size != os.path.getsize(journal_file):
+            os.truncate(journal_file, journal_size)
+    except OSError:
+        pass
 
 
+# The one interface of a group, None when it has none or several
+def sole_iface(group):
+    members = [i for i, g in state["iface_groups"].items() if g == group]
+    return members[0] if len(members) == 1 else None
+
+
+# Appends what changed since the last record, nothing when nothing did. The diff is
+# taken with signals held, a checkpoint in between would already contain it
+def journal_state():
+    global journal_base, journal_size
+    with deferred_signals():
+        added, changed, ifaces = {}, {}, {}
+        for key, value in state.items():
+            old = journal_base.get(key)
+            if key == "journal_seq" or value == old:
+                continue
+            if key == "last_proc_ifaces" and isinstance(old, dict):
+                for iface in old.keys() - value.keys():
+                    ifaces[iface] = None
+                for iface, count in value.items():
+                    if old.get(iface) != count:
+                        ifaces[iface] = count
+            elif (
+                key.startswith(counter_prefixes)
+                and isinstance(old, int)
+                and value > old
+            ):
+                added[key] = value - old
+            else:
+                changed[key] = value
+        if not added and not changed and not ifaces:
+            return
+        for group in {key.split("_", 1)[1] for key in added}:
+            delta = added.get("daily_" + group)
+            if any(added.get(period + group) != delta for period in counter_prefixes):
+                continue
+            for period in counter_prefixes:
+                del added[period + group]
+            added[group] = delta
+            iface = sole_iface(group)
+            old = journal_base["last_proc_ifaces"].get(iface)
+            if iface in ifaces and old is not None and ifaces[iface] == old + delta:
+                del ifaces[iface]
+        seq = state["journal_seq"] + 1
+        record = {"s": seq}
+        if added:
+            record["+"] = added
+        if ifaces:
+            record["i"] = ifaces
+        if changed:
+            record["="] = changed
+        line = (json.dumps(record, separators=(",", ":")) + "\n").encode()
+        try:
+            fd = os.open(journal_file, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+            try:
+                os.write(fd, line)
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+        except OSError:
+            return
+        state["journal_seq"] = seq
+        journal_size += len(line)
+        journal_base = copy.deepcopy(state)
+
+
+# Checkpoint: the whole state to usage.json, then the journal it covers is dropped
 def save_state():
+    global journal_base, journal_size, last_checkpoint
     temp_file = usage_file + ".tmp"
-    try:
-        with open(temp_file, "w") as f:
-            json.dump(state, f, indent=4)
-        os.replace(temp_file, usage_file)
-    except Exception:
-        pass
+    with deferred_signals():
+        try:
+            with open(temp_file, "w") as f:
+                json.dump(state, f, indent=4)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(temp_file, usage_file)
+            dir_fd = os.open(config_dir, os.O_RDONLY)
+            try:
+                os.fsync(dir_fd)
+            finally:
+                os.close(dir_fd)
+            # a crash before this leaves records the checkpoint already has, replay skips them by seq
+            with open(journal_file, "w"):
+                pass
+            journal_size = 0
+            journal_base = copy.deepcopy(state)
+        except Exception:
+            pass
+        last_checkpoint = time.monotonic()
 
 
 # Calculates the date of the next monthly reset based on the current date.
@@ -154,6 +337,17 @@ def calculate_next_reset_date(reset_day):
     return datetime(year, month, actual_reset_day).date()
 
 
+# Start of the current billing period, one month before the next reset
+def calculate_last_reset_date(reset_day):
+    next_reset = calculate_next_reset_date(reset_day)
+    year, month = next_reset.year, next_reset.month - 1
+    if month < 1:
+        month = 12
+        year -= 1
+    _, last_day_of_month = calendar.monthrange(year, month)
+    return datetime(year, month, min(reset_day, last_day_of_month)).date()
+
+
 # Signal Handling & Reconfiguration
 def trigger_reconfig():
     if not os.path.exists(pid_file):
@@ -188,6 +382,8 @@ def handle_reconfig_signal(sig, frame):
 
 
 def handle_exit(sig, frame):
+    if history is not None:
+        history.flush()
     save_state()
     if os.path.exists(pid_file):
         try:
@@ -224,26 +420,412 @@ def format_speed(bps):
     return f"{bps:.1f}T/s"
 
 
-def read_proc_net():
-    wifi_rx = wifi_tx = eth_rx = eth_tx = 0
+# The (unit, rounded value) format_bytes/format_speed would show, so an unchanged
+# display can be spotted without building any strings
+def display_step(num):
+    unit = 0
+    while num >= 1024 and unit < 5:
+        num /= 1024
+        unit += 1
+    return unit, round(num, 1)
+
+
+def usage_lines(groups, values, label):
+    return "".join(
+        f"{group_labels.get(g, g)} {label}: {format_bytes(values.get(g, 0))}\n"
+        for g in groups
+    )
+
+
+def build_tooltip(
+    groups, session, daily_str, monthly_str, life_total, in_speed, out_speed
+):
+    in_fmt = f"<span color='{primary_color}'>{format_speed(in_speed)}</span>"
+    out_fmt = f"<span color='{secondary_color}'>{format_speed(out_speed)}</span>"
+    daily = {g: state.get(f"daily_{g}", 0) for g in groups}
+    monthly = {g: state.get(f"monthly_{g}", 0) for g in groups}
+    return (
+        "<big><b><u>Waybar Data Manager</u></b></big>\n\n"
+        "<b>This Session</b> (Since Boot)\n"
+        f"{usage_lines(groups, session, 'Usage')}\n"
+        "<b>Today's Usage</b>\n"
+        f"{usage_lines(groups, daily, 'Usage')}"
+        f"Total: {daily_str}\n\n"
+        f"<b>This Month</b> (Resets on {state.get('next_monthly_reset_date', 'N/A')})\n"
+        f"{usage_lines(groups, monthly, 'usage')}"
+        f"Total : {monthly_str}\n\n"
+        "<b>Life Time</b>\n"
+        f"Total data: {format_bytes(life_total)}\n\n"
+        "<b>Speed</b>\n"
+        f"Incoming: {in_fmt}\n"
+        f"Outgoing: {out_fmt}"
+    )
+
+
+# Groups with counters in the state, WiFi and Ethernet first since they are always shown
+def state_groups():
+    groups = ["wifi", "eth"]
+    for key in sorted(state):
+        if key.startswith("life_") and key[5:] not in groups:
+            groups.append(key[5:])
+    return groups
+
+
+net_dir = "/sys/class/net"
+tether_drivers = ("rndis_host", "cdc_ether", "cdc_eem", "cdc_ncm", "ipheth")
+mobile_drivers = ("qmi_wwan", "cdc_mbim", "huawei_cdc_ncm")
+
+
+def read_sysfs(path):
     try:
-        with open("/proc/net/dev") as f:
-            for line in f.readlines()[2:]:
-                if ":" not in line:
-                    continue
-                iface, data = line.split(":", 1)
-                data = data.split()
-                rx, tx = int(data[0]), int(data[8])
-                iface = iface.strip()
-                if iface.startswith(("wlan", "wlp", "wls")):
-                    wifi_rx += rx
-                    wifi_tx += tx
-                elif iface.startswith(("eth", "enp", "eno", "ens")):
-                    eth_rx += rx
-                    eth_tx += tx
-    except Exception:
-        pass
-    return wifi_rx, wifi_tx, eth_rx, eth_tx
+        with open(path, "r") as f:
+            return f.read().strip()
+    except OSError:
+        return ""
+
+
+# Interface group from sysfs, decided once per interface when the link set changes.
+# None for interfaces that aren't counted: loopback and virtual ones (veth, bridges,
+# bonds, docker), whose traffic already shows up on a real interface
+def classify_iface(iface):
+    for pattern, group in config.get("interface_groups", {}).items():
+        if fnmatch.fnmatchcase(iface, pattern):
+            return group or None
+    base = os.path.join(net_dir, iface)
+    if not os.path.isdir(base):  # no sysfs, go by name
+        if iface.startswith(("wlan", "wlp", "wls")):
+            return "wifi"
+        if iface.startswith(("eth", "enp", "eno", "ens")):
+            return "eth"
+        return None
+    devtype = ""
+    for line in read_sysfs(os.path.join(base, "uevent")).splitlines():
+        if line.startswith("DEVTYPE="):
+            devtype = line[8:]
+    if devtype == "wlan" or os.path.exists(os.path.join(base, "wireless")):
+        return "wifi"
+    if devtype == "wwan":
+        return "mobile"
+    if devtype == "wireguard" or os.path.exists(os.path.join(base, "tun_flags")):
+        return "vpn"
+    try:
+        arp_type = int(read_sysfs(os.path.join(base, "type")))
+    except ValueError:
+        return None
+    if arp_type in (512, 519):  # ppp, raw ip (modems)
+        return "mobile"
+    if arp_type in (768, 769, 776, 778, 823, 65534):  # ip tunnels, gre, no link layer
+        return "vpn"
+    if arp_type != 1 or not os.path.exists(os.path.join(base, "device")):
+        return None
+    driver = os.path.basename(os.path.realpath(os.path.join(base, "device", "driver")))
+    if driver in tether_drivers:
+        return "tether"
+    if driver in mobile_drivers:
+        return "mobile"
+    return "eth"
+
+
+# Counter backends: refresh() rebuilds the tracked interface set and their groups,
+# read() returns {iface: (group, rx, tx)} of the tracked interfaces
+class SysfsCounters:
+    # statistics/{rx,tx}_bytes of tracked interfaces only, kept open and re-read with pread
+    def __init__(self):
+        self.ifaces = {}  # iface -> (group, rx fd, tx fd)
+        self.stale = True
+
+    # Reopens every tracked interface: one unplugged and replugged under the same
+    # name between two ticks is a new netdev, its old descriptors stay dead
+    def refresh(self):
+        for iface in list(self.ifaces):
+            self.close_iface(iface)
+        try:
+            names = os.listdir(net_dir)
+        except OSError:
+            names = []
+        for iface in names:
+            group = classify_iface(iface)
+            if group is None:
+                continue
+            stats = os.path.join(net_dir, iface, "statistics")
+            try:
+                rx_fd = os.open(os.path.join(stats, "rx_bytes"), os.O_RDONLY)
+            except OSError:
+                continue
+            try:
+                tx_fd = os.open(os.path.join(stats, "tx_bytes"), os.O_RDONLY)
+            except OSError:
+                os.close(rx_fd)
+                continue
+            self.ifaces[iface] = (group, rx_fd, tx_fd)
+        self.stale = False
+
+    def close_iface(self, iface):
+        _, rx_fd, tx_fd = self.ifaces.pop(iface)
+        for fd in (rx_fd, tx_fd):
+            try:
+                os.close(fd)
+            except OSError:
+                pass
+
+    def read(self):
+        if self.stale:
+            self.refresh()
+        counters = {}
+        for iface, (group, rx_fd, tx_fd) in list(self.ifaces.items()):
+            try:
+                counters[iface] = (
+                    group,
+                    int(os.pread(rx_fd, 32, 0)),
+                    int(os.pread(tx_fd, 32, 0)),
+                )
+            except (
+                OSError,
+                ValueError,
+            ):  # the interface went away, reopen on the next tick
+                self.close_iface(iface)
+                self.stale = True
+        return counters
+
+
+class ProcNetCounters:
+    # /proc/net/dev, for systems without sysfs
+    def __init__(self):
+        self.groups = {}  # iface -> group, None for untracked interfaces
+        self.stale = True
+
+    def refresh(self):
+        self.groups = {}
+        self.stale = False
+
+    def read(self):
+        if self.stale:
+            self.refresh()
+        counters = {}
+        try:
+            with open("/proc/net/dev") as f:
+                for line in f.readlines()[2:]:
+                    if ":" not in line:
+                        continue
+                    iface, data = line.split(":", 1)
+                    iface = iface.strip()
+                    if iface not in self.groups:
+                        self.groups[iface] = classify_iface(iface)
+                    group = self.groups[iface]
+                    if group is None:
+                        continue
+                    data = data.split()
+                    counters[iface] = (group, int(data[0]), int(data[8]))
+        except Exception:
+            pass
+        return counters
+
+
+def make_counters(name):
+    if name != "proc" and os.path.isdir(net_dir):
+        return SysfsCounters()
+    return ProcNetCounters()
+
+
+# Link add/remove/rename events from rtnetlink, so the interface set is only
+# rebuilt when it can have changed. Without netlink it is rebuilt every 30 ticks.
+class LinkEvents:
+    RTMGRP_LINK = 1
+    RTM_NEWLINK = 16
+    RTM_DELLINK = 17
+
+    def __init__(self):
+        self.sock = None
+        try:
+            self.sock = socket.socket(
+                socket.AF_NETLINK,
+                socket.SOCK_RAW | socket.SOCK_NONBLOCK,
+                socket.NETLINK_ROUTE,
+            )
+            self.sock.bind((0, self.RTMGRP_LINK))
+        except (OSError, AttributeError):
+            self.sock = None
+        self.ticks = 0
+
+    def changed(self):
+        if self.sock is None:
+            self.ticks += 1
+            return self.ticks % 30 == 0
+        changed = False
+        while True:
+            try:
+                data = self.sock.recv(65536)
+            except BlockingIOError:
+                return changed
+            except OSError:  # ENOBUFS, events were dropped
+                return True
+            offset = 0
+            while offset + 16 <= len(data):
+                length, msg_type = struct.unpack_from("=LH", data, offset)
+                if msg_type in (self.RTM_NEWLINK, self.RTM_DELLINK):
+                    changed = True
+                if length < 16:
+                    break
+                offset += (length + 3) & ~3
+
+
+# Usage history in history.db: per-minute samples for the last history_minute_hours,
+# hourly and daily rollups kept much longer. Traffic is summed in memory and written
+# as one transaction per minute that updates the minute row and both rollups, so
+# older minutes and hours can simply be deleted. WAL mode lets --report read while
+# the monitor writes.
+history_tables = ("minute", "hour", "day")
+
+
+class HistoryStore:
+    def __init__(self, path):
+        self.db = None
+        self.minute = None
+        self.pending = {}  # group -> [rx, tx] of the current minute
+        self.last_compact = 0
+        if sqlite3 is None:
+            return
+        try:
+            self.db = sqlite3.connect(path, isolation_level=None)
+            self.db.execute(
+                "PRAGMA auto_vacuum=INCREMENTAL"
+            )  # only takes effect on a new file
+            self.db.execute("PRAGMA journal_mode=WAL")
+            self.db.execute("PRAGMA synchronous=NORMAL")
+            for table in history_tables:
+                self.db.execute(
+                    f"CREATE TABLE IF NOT EXISTS {table} (ts INTEGER NOT NULL, grp TEXT NOT NULL, "
+                    "rx INTEGER NOT NULL, tx INTEGER NOT NULL, PRIMARY KEY (ts, grp)) WITHOUT ROWID"
+                )
+        except sqlite3.Error:
+            self.db = None
+
+    def add(self, now, traffic):
+        minute = int(now) // 60 * 60
+        if minute != self.minute:
+            self.flush()
+            self.minute = minute
+        for group, (rx, tx) in traffic.items():
+            if rx or tx:
+                p = self.pending.setdefault(group, [0, 0])
+                p[0] += rx
+                p[1] += tx
+
+    def flush(self):
+        pending, self.pending = self.pending, {}
+        if not pending or self.db is None:
+            return
+        local = datetime.fromtimestamp(self.minute)
+        buckets = (
+            self.minute,
+            int(local.replace(minute=0, second=0).timestamp()),
+            int(local.replace(hour=0, minute=0, second=0).timestamp()),
+        )
+        try:
+            self.db.execute("BEGIN")
+            for table, ts in zip(history_tables, buckets):
+                self.db.executemany(
+                    f"INSERT INTO {table} VALUES (?, ?, ?, ?) ON CONFLICT (ts, grp) "
+                    "DO UPDATE SET rx = rx + excluded.rx, tx = tx + excluded.tx",
+                    [(ts, group, rx, tx) for group, (rx, tx) in pending.items()],
+                )
+            self.db.execute("COMMIT")
+        except sqlite3.Error:
+            if self.db.in_transaction:
+                self.db.execute("ROLLBACK")
+            return
+        if self.minute - self.last_compact >= 3600:
+            self.compact()
+
+    # Drops samples that are already in the coarser table and gives the pages back
+    def compact(self):
+        self.last_compact = self.minute
+        minute_hours = config.get(
+            "history_minute_hours", default_config["history_minute_hours"]
+        )
+        hour_days = config.get("history_hour_days", default_config["history_hour_days"])
+        try:
+            self.db.execute(
+                "DELETE FROM minute WHERE ts < ?", (self.minute - minute_hours * 3600,)
+            )
+            self.db.execute(
+                "DELETE FROM hour WHERE ts < ?", (self.minute - hour_days * 86400,)
+            )
+            self.db.execute("PRAGMA incremental_vacuum")
+        except sqlite3.Error:
+            pass
+
+
+history = None
+
+
+# --report day|month: usage per hour of today or per day of the billing period,
+# read from history.db without touching the running monitor
+def print_report(period):
+    signal.signal(signal.SIGINT, signal.SIG_DFL)  # nothing of the monitor to save here
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    if period not in ("day", "month"):
+        print("usage: data_monitor.py --report day|month")
+        sys.exit(2)
+    if sqlite3 is None or not os.path.exists(history_file):
+        print("No usage history yet.")
+        sys.exit(1)
+    load_config()
+    counted = config.get("counted_groups", default_config["counted_groups"])
+    now = datetime.now()
+    if period == "day":
+        table, start, fmt = (
+            "hour",
+            now.replace(hour=0, minute=0, second=0, microsecond=0),
+            "%H:00",
+        )
+        title = f"Usage on {now.strftime('%Y-%m-%d')}"
+    else:
+        reset_day = config.get("reset_day", 11)
+        start = datetime.combine(
+            calculate_last_reset_date(reset_day), datetime.min.time()
+        )
+        table, fmt = "day", "%Y-%m-%d"
+        title = f"Usage since {start.strftime('%Y-%m-%d')} (resets on {calculate_next_reset_date(reset_day)})"
+    try:
+        db = sqlite3.connect(f"file:{history_file}?mode=ro", uri=True)
+        rows = db.execute(
+            f"SELECT ts, grp, rx, tx FROM {table} WHERE ts >= ? ORDER BY ts",
+            (int(start.timestamp()),),
+        ).fetchall()
+        db.close()
+    except sqlite3.Error as e:
+        print(f"Cannot read {history_file}: {e}")
+        sys.exit(1)
+
+    buckets = {}
+    groups = []
+    total_rx = total_tx = 0
+    for ts, group, rx, tx in rows:
+        buckets.setdefault(ts, {})[group] = rx + tx
+        if group not in groups:
+            groups.append(group)
+        if group in counted:
+            total_rx += rx
+            total_tx += tx
+    order = list(group_labels)
+    groups.sort(key=lambda g: (order.index(g) if g in order else len(order), g))
+    columns = [group_labels.get(g, g) for g in groups] + ["Total"]
+    width = max([12] + [len(c) + 2 for c in columns])
+    print(title)
+    print(f"{'':<12}" + "".join(f"{c:>{width}}" for c in columns))
+    for ts, values in buckets.items():
+        cells = [values.get(g, 0) for g in groups]
+        total = sum(values.get(g, 0) for g in groups if g in counted)
+        label = datetime.fromtimestamp(ts).strftime(fmt)
+        print(
+            f"{label:<12}"
+            + "".join(f"{format_bytes(n):>{width}}" for n in cells + [total])
+        )
+    print(
+        f"Total: {format_bytes(total_rx + total_tx)} (in {format_bytes(total_rx)}, out {format_bytes(total_tx)})"
+    )
+    sys.exit(0)
 
 
 # Alert & Reset Logic
@@ -269,8 +851,8 @@ def reset_notification_flags(period_name):
 def check_daily_reset():
     now_date = datetime.now().strftime("%Y-%m-%d")
     if state["last_reset_date"] != now_date:
-        state["daily_wifi"] = 0
-        state["daily_eth"] = 0
+        for group in state_groups():
+            state[f"daily_{group}"] = 0
         state["last_reset_date"] = now_date
         reset_notification_flags("daily")
 
@@ -283,49 +865,89 @@ def check_daily_reset():
 def main():
     if len(sys.argv) > 1 and sys.argv[1] == "--reconfig":
         trigger_reconfig()
+    if len(sys.argv) > 1 and sys.argv[1] == "--report":
+        print_report(sys.argv[2] if len(sys.argv) > 2 else "day")
 
-    global state
+    global state, history
     ensure_dirs()
     write_pid()
     load_config()
     load_state()
     update_colors()
-
-    last_wifi_raw = state["last_proc_wifi"]
-    last_eth_raw = state["last_proc_eth"]
-    last_rx, last_tx = 0, 0
-    first_run, tick_counter = True, 0
+    if config.get("history", True):
+        history = HistoryStore(history_file)
+
+    # interface -> rx+tx already counted. state written before per-interface
+    # counters has none, then counting starts from the current counters
+    migrate = "last_proc_wifi" in state and not state["last_proc_ifaces"]
+    last_ifaces = dict(state["last_proc_ifaces"])
+    last_speed = None  # interface -> (rx, tx) of the previous tick
+    tick_counter = 0
+    last_sync = time.monotonic()
+    last_tooltip_key, tooltip, last_output = None, "", None
+    counters = make_counters(config.get("counter_backend", "sysfs"))
+    link_events = LinkEvents()
 
     while True:
-        wifi_rx, wifi_tx, eth_rx, eth_tx = read_proc_net()
-        wifi_total, eth_total = wifi_rx + wifi_tx, eth_rx + eth_tx
-        curr_rx, curr_tx = wifi_rx + eth_rx, wifi_tx + eth_tx
-
-        if first_run:
-            last_rx, last_tx, first_run = curr_rx, curr_tx, False
+        if link_events.changed():
+            counters.refresh()
+        current = counters.read()
+        counted = config.get("counted_groups", default_config["counted_groups"])
+
+        if last_speed is None:
+            last_speed = {iface: (rx, tx) for iface, (group, rx, tx) in current.items()}
+            if migrate:
+                last_ifaces = {
+                    iface: rx + tx for iface, (group, rx, tx) in current.items()
+                }
+                for key in ("last_proc_wifi", "last_proc_eth"):
+                    state.pop(key, None)
             time.sleep(1)
             continue
 
-        in_speed = max(curr_rx - last_rx, 0)
-        out_speed = max(curr_tx - last_tx, 0)
-        delta_wifi = (
-            wifi_total - last_wifi_raw if wifi_total >= last_wifi_raw else wifi_total
+        in_speed = out_speed = 0
+        session, deltas, traffic = {}, {}, {}
+        for iface, (group, rx, tx) in current.items():
+            total = rx + tx
+            session[group] = session.get(group, 0) + total
+            last = last_ifaces.get(iface, 0)
+            deltas[group] = deltas.get(group, 0) + (
+                total - last if total >= last else total
+            )
+            last_rx, last_tx = last_speed.get(iface, (0, 0))
+            rx_delta = rx - last_rx if rx >= last_rx else rx
+            tx_delta = tx - last_tx if tx >= last_tx else tx
+            t = traffic.setdefault(group, [0, 0])
+            t[0] += rx_delta
+            t[1] += tx_delta
+            if group in counted and iface in last_speed:
+                in_speed += rx_delta
+                out_speed += tx_delta
+        if history is not None:
+            history.add(time.time(), traffic)
+        # interfaces that went away are forgotten, a new one counts from its first byte
+        last_ifaces = {iface: rx + tx for iface, (group, rx, tx) in current.items()}
+        iface_groups = {iface: group for iface, (group, rx, tx) in current.items()}
+        if iface_groups != state["iface_groups"]:
+            state["iface_groups"] = iface_groups
+        last_speed = {iface: (rx, tx) for iface, (group, rx, tx) in current.items()}
+        state["last_proc_ifaces"] = last_ifaces
+
+        for group, delta in deltas.items():
+            for period in ("monthly", "daily", "life"):
+                state[f"{period}_{group}"] = state.get(f"{period}_{group}", 0) + delta
+
+        # groups that never saw traffic besides wifi and ethernet stay out of the tooltip
+        groups = [
+            g
+            for g in state_groups()
+            if g in ("wifi", "eth") or state.get(f"life_{g}", 0) > 0
+        ]
+        monthly_total = sum(
+            state.get(f"monthly_{g}", 0) for g in groups if g in counted
         )
-        delta_eth = eth_total - last_eth_raw if eth_total >= last_eth_raw else eth_total
-
-        state["monthly_wifi"] += delta_wifi
-        state["monthly_eth"] += delta_eth
-        state["life_wifi"] += delta_wifi
-        state["life_eth"] += delta_eth
-        state["daily_wifi"] += delta_wifi
-        state["daily_eth"] += delta_eth
-        state["last_proc_wifi"] = wifi_total
-        state["last_proc_eth"] = eth_total
-
-        monthly_total = state["monthly_wifi"] + state["monthly_eth"]
-        daily_total = state["daily_wifi"] + state["daily_eth"]
-        life_total = state["life_wifi"] + state["life_eth"]
-
+        daily_total = sum(state.get(f"daily_{g}", 0) for g in groups if g in counted)
+        life_total = sum(state.get(f"life_{g}", 0) for g in groups if g in counted)
         check_alerts(daily_total, config["limit_daily_gb"], "daily")
         check_alerts(monthly_total, config["limit_monthly_gb"], "monthly")
 
@@ -341,70 +963,88 @@ def main():
                 next_reset_date = datetime(1970, 1, 1).date()
 
             if today >= next_reset_date:
-                state["monthly_wifi"] = 0
-                state["monthly_eth"] = 0
+                for group in state_groups():
+                    state[f"monthly_{group}"] = 0
                 reset_notification_flags("monthly")
                 reset_day_cfg = config.get("reset_day", 11)
                 new_next_date = calculate_next_reset_date(reset_day_cfg)
                 state["next_monthly_reset_date"] = new_next_date.strftime("%Y-%m-%d")
                 save_state()
 
-        if tick_counter >= 60:
+        now = time.monotonic()
+        if now - last_sync >= config.get(
+            "sync_seconds", default_config["sync_seconds"]
+        ):
+            journal_state()
+            last_sync = now
+        if (
+            now - last_checkpoint
+            >= config.get("checkpoint_minutes", default_config["checkpoint_minutes"])
+            * 60
+            or journal_size >= 256 * 1024
+        ):
             save_state()
+
+        if tick_counter >= 60:
             tick_counter = 0
         tick_counter += 1
 
         dominant_icon = icon_down if in_speed >= out_speed else icon_up
         dominant_speed = max(in_speed, out_speed)
-        in_fmt = f"<span color='{primary_color}'>{format_speed(in_speed)}</span>"
-        out_fmt = f"<span color='{secondary_color}'>{format_speed(out_speed)}</span>"
+        text = f"{dominant_icon} {format_speed(dominant_speed)}"
 
+        # The tooltip is only rebuilt when something it shows changes at the displayed precision
         limit_m_gb = config["limit_monthly_gb"]
-        monthly_str = f"{format_bytes(monthly_total)} / {limit_m_gb}GB"
-        if limit_m_gb > 0 and monthly_total >= 0.9 * (limit_m_gb * 1024**3):
-            monthly_str = f"<span color='{secondary_color}'>{monthly_str}</span>"
-
         limit_d_gb = config["limit_daily_gb"]
-        if limit_d_gb <= 0:
-            daily_str = format_bytes(daily_total)
-        else:
-            daily_str = f"{format_bytes(daily_total)} / {limit_d_gb}GB"
-            if daily_total >= 0.9 * (limit_d_gb * 1024**3):
-                daily_str = f"<span color='{secondary_color}'>{daily_str}</span>"
-
-        # WAYBAR TOOLTIP
-        tooltip = (
-            "<big><b><u>Waybar Data Manager</u></b></big>\n\n"
-            "<b>This Session</b> (Since Boot)\n"
-            f"WiFi Usage: {format_bytes(wifi_total)}\n"
-            f"Ethernet Usage: {format_bytes(eth_total)}\n\n"
-            "<b>Today's Usage</b>\n"
-            f"WiFi Usage: {format_bytes(state['daily_wifi'])}\n"
-            f"Ethernet Usage: {format_bytes(state['daily_eth'])}\n"
-            f"Total: {daily_str}\n\n"
-            f"<b>This Month</b> (Resets on {state.get('next_monthly_reset_date', 'N/A')})\n"
-            f"Wifi usage: {format_bytes(state['monthly_wifi'])}\n"
-            f"Ethernet usage: {format_bytes(state['monthly_eth'])}\n"
-            f"Total : {monthly_str}\n\n"
-            "<b>Life Time</b>\n"
-            f"Total data: {format_bytes(life_total)}\n\n"
-            "<b>Speed</b>\n"
-            f"Incoming: {in_fmt}\n"
-            f"Outgoing: {out_fmt}"
-        )
-
-        print(
-            json.dumps(
-                {
-                    "text": f"{dominant_icon} {format_speed(dominant_speed)}",
-                    "tooltip": tooltip,
-                }
+        monthly_alert = limit_m_gb > 0 and monthly_total >= 0.9 * (limit_m_gb * 1024**3)
+        daily_alert = limit_d_gb > 0 and daily_total >= 0.9 * (limit_d_gb * 1024**3)
+        tooltip_key = (
+            tuple(
+                display_step(n)
+                for g in groups
+                for n in (
+                    session.get(g, 0),
+                    state.get(f"daily_{g}", 0),
+                    state.get(f"monthly_{g}", 0),
+                )
             ),
-            flush=True,
+            tuple(groups),
+            display_step(daily_total),
+            display_step(monthly_total),
+            display_step(life_total),
+            display_step(in_speed),
+            display_step(out_speed),
+            limit_m_gb,
+            limit_d_gb,
+            monthly_alert,
+            daily_alert,
+            state.get("next_monthly_reset_date"),
+            primary_color,
+            secondary_color,
         )
+        if tooltip_key != last_tooltip_key:
+            monthly_str = f"{format_bytes(monthly_total)} / {limit_m_gb}GB"
+            if monthly_alert:
+                monthly_str = f"<span color='{secondary_color}'>{monthly_str}</span>"
+
+            if limit_d_gb <= 0:
+                daily_str = format_bytes(daily_total)
+            else:
+                daily_str = f"{format_bytes(daily_total)} / {limit_d_gb}GB"
+                if daily_alert:
+                    daily_str = f"<span color='{secondary_color}'>{daily_str}</span>"
+
+            # WAYBAR TOOLTIP
+            tooltip = build_tooltip(
+                groups, session, daily_str, monthly_str, life_total, in_speed, out_speed
+            )
+            last_tooltip_key = tooltip_key
+
+        # Waybar keeps showing the last line, so identical output is not sent again
+        if (text, tooltip) != last_output:
+            print(json.dumps({"text": text, "tooltip": tooltip}), flush=True)
+            last_output = (text, tooltip)
 
-        last_rx, last_tx = curr_rx, curr_tx
-        last_wifi_raw, last_eth_raw = wifi_total, eth_total
         time.sleep(1)
 
 